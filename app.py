@@ -1,26 +1,33 @@
-import streamlit as st
-import pandas as pd
-import gspread
+import time
+
+_run_t0 = time.perf_counter()
+
+import functools
+import sys
 from datetime import datetime, timedelta, date
+
+import streamlit as st
 import pytz
-from pycbrf.toolbox import ExchangeRates
-import plotly.express as px
-import plotly.graph_objects as go
-import re
-from streamlit_extras.metric_cards import style_metric_cards
+
+from metrics import incr, metrics, observe, stage, timing
 
 # ────────────────────────────────────────────────────────────────
 #  Секреты (берём из Streamlit Cloud или .env при локальной работе)
 # ────────────────────────────────────────────────────────────────
-creds = st.secrets["google_service_account"]
-client = gspread.service_account_from_dict(creds)
-
 MOLOCO_SHEET_ID        = st.secrets["MOLOCO_SHEET_ID"]
 OTHER_SOURCES_SHEET_ID = st.secrets["OTHER_SOURCES_SHEET_ID"]
 DASHBOARD_PASSWORD     = st.secrets["DASHBOARD_PASSWORD"]
+REFRESH_INTERVAL_MIN   = float(st.secrets.get("REFRESH_INTERVAL_MIN", 60))
+ADMIN_PANEL            = bool(st.secrets.get("ADMIN_PANEL", False))
+# Путь к файлу SQLite: версии данных хранятся в нём, а не в памяти процесса
+ANALYTICS_DB           = st.secrets.get("ANALYTICS_DB", "")
+
+MSK = pytz.timezone("Europe/Moscow")
+# Больше ячеек сводной браузер не получает: показываем первые строки
+PIVOT_MAX_CELLS = 200_000
 
 # ────────────────────────────────────────────────────────────────
-#  Авторизация
+#  Авторизация: до тяжёлых импортов, чтобы форма входа появлялась сразу
 # ────────────────────────────────────────────────────────────────
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -30,159 +37,335 @@ if not st.session_state.authenticated:
     if pwd and pwd == DASHBOARD_PASSWORD:
         st.session_state.authenticated = True
     else:
+        timing("startup.login", (time.perf_counter() - _run_t0) * 1000)
         st.stop()
 else:
     st.sidebar.success("Вы авторизованы")
 
 # ────────────────────────────────────────────────────────────────
-#  Вспомогательные функции
+#  Тяжёлые модули (pandas, plotly, gspread): импортируются после входа,
+#  один раз на процесс — на следующих прогонах они уже в sys.modules
 # ────────────────────────────────────────────────────────────────
-def clean_num(s: str) -> float:
-    t = re.sub(r"\s+", "", s)
-    return float(t.replace(",", "."))
+_cold = "charts" not in sys.modules
+_import_t0 = time.perf_counter()
 
-@st.cache_data(show_spinner=False)
-def fetch_moloco_raw():
-    sh = client.open_by_key(MOLOCO_SHEET_ID)
-    rows = []
-    for ws in sh.worksheets():
-        vals = ws.get_all_values()
-        header = vals[0]
-        rows.extend(dict(zip(header, r)) for r in vals[1:])
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        df["traffic_source"] = "Moloco"
-    return df
-
-@st.cache_data(show_spinner=False)
-def fetch_other_raw():
-    sh = client.open_by_key(OTHER_SOURCES_SHEET_ID)
-    vals = sh.get_worksheet(0).get_all_values()
-    header = vals[0]
-    df = pd.DataFrame(vals[1:], columns=header)
-    if "traffic_source" not in df.columns:
-        df["traffic_source"] = "Other"
-    return df
-
-@st.cache_data(ttl=3600)
-def get_rates():
-    try:
-        rates = ExchangeRates(date.today())
-        return float(rates["USD"].value), float(rates["EUR"].value)
-    except Exception:
-        return None, None
+import pandas as pd
+import plotly.io as pio
 
-# ────────────────────────────────────────────────────────────────
-#  State
-# ────────────────────────────────────────────────────────────────
-for key in ("moloco", "other"):
-    st.session_state.setdefault(key, pd.DataFrame())
-st.session_state.setdefault("loaded", False)
-st.session_state.setdefault("last_update", None)
+from charts import TREND_WINDOWS, top_bayers_figure, trend_figure
+from cube import DIMENSIONS, TIME_GRAINS
+from fx import FxTable, apply_fx
+from normalize import normalize_moloco, normalize_other
+from pivot import DIMENSION_LABELS, PivotEngine, PivotSpec
+from refresh import Refresher
+from sheets import fetch_moloco, fetch_other, read_snapshots
+from sqlstore import SqlStore
+from store import DatasetStore
+
+if _cold:
+    timing("startup.imports", (time.perf_counter() - _import_t0) * 1000)
 
 # ────────────────────────────────────────────────────────────────
-#  Sidebar
+#  Вспомогательные функции
 # ────────────────────────────────────────────────────────────────
-st.sidebar.title("Навигация")
-menu = st.sidebar.radio("", ["Главная", "Диаграммы", "Сводные таблицы", "Табличные данные"])
-st.sidebar.markdown("---")
+@st.cache_resource(show_spinner=False)
+def get_client():
+    """Клиент gspread: создаётся при первой загрузке листов, один на процесс."""
+    import gspread
+    return gspread.service_account_from_dict(st.secrets["google_service_account"])
 
-usd_rate, eur_rate = get_rates()
-st.sidebar.caption(f"USD/RUB: {usd_rate:.2f}" if usd_rate else "USD/RUB: —")
-st.sidebar.caption(f"EUR/RUB: {eur_rate:.2f}" if eur_rate else "EUR/RUB: —")
-st.sidebar.markdown("---")
+def fetch_moloco_raw():
+    return fetch_moloco(get_client(), MOLOCO_SHEET_ID)
 
-if st.sidebar.button("Обновить"):
-    st.session_state["moloco"] = fetch_moloco_raw()
-    st.session_state["other"] = fetch_other_raw()
-    st.session_state["loaded"] = True
-    st.session_state["last_update"] = datetime.now(pytz.timezone("Europe/Moscow"))
+def fetch_other_raw():
+    return fetch_other(get_client(), OTHER_SOURCES_SHEET_ID)
+
+@st.cache_resource(show_spinner=False)
+def get_fx():
+    return FxTable()
+
+fx_table = get_fx()
+
+def load_sources():
+    """Синхронизация обоих листов; вызывается из фонового потока."""
+    raw_m, raw_o = fetch_moloco_raw(), fetch_other_raw()
+    with stage("parse"):
+        moloco, other = normalize_moloco(raw_m), normalize_other(raw_o)
+    with stage("fx"):
+        dates = pd.concat([moloco["event_date"], other["event_date"]]).dropna()
+        if not dates.empty:
+            # Курсы за новые дни (и сегодняшний для боковой панели) — одним запросом
+            fx_table.ensure(dates.min(), max(dates.max(), pd.Timestamp(date.today())))
+        moloco, other = apply_fx(moloco, fx_table), apply_fx(other, fx_table)
+    return moloco, other, datetime.now(MSK)
+
+def load_snapshots():
+    """Версия из локальных снимков — для мгновенного старта после перезапуска."""
+    snap_m = read_snapshots(MOLOCO_SHEET_ID)
+    snap_o = read_snapshots(OTHER_SOURCES_SHEET_ID)
+    if snap_m is None or snap_o is None:
+        return None
+    (raw_m, ts_m), (raw_o, ts_o) = snap_m, snap_o
+    return (
+        apply_fx(normalize_moloco(raw_m), fx_table),
+        apply_fx(normalize_other(raw_o), fx_table),
+        min(ts_m, ts_o).astimezone(MSK),
+    )
 
-if ts := st.session_state["last_update"]:
-    st.sidebar.caption(ts.strftime("Обновлено: %Y-%m-%d %H:%M"))
-st.sidebar.caption("✅ Данные загружены" if st.session_state["loaded"] else "❌ Данные не загружены")
+def counted_cache(**cache_kwargs):
+    """st.cache_data со счётчиками обращений и промахов для панели метрик."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def miss(*args, **kwargs):
+            incr(f"cache.{fn.__name__}.miss")
+            return fn(*args, **kwargs)
+        cached = st.cache_data(**cache_kwargs)(miss)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            incr(f"cache.{fn.__name__}.calls")
+            return cached(*args, **kwargs)
+        call.clear = cached.clear
+        return call
+    return deco
 
 # ────────────────────────────────────────────────────────────────
-#  Главная
+#  State: данные общие для процесса, в сессии — только номер версии
 # ────────────────────────────────────────────────────────────────
-if menu == "Главная":
-    st.title("Dashboard: Затраты рекламы")
-    st.markdown(
-        "Добро пожаловать в дашборд мониторинга затрат по источникам трафика."
-    )
-
-    if not st.session_state["loaded"]:
-        st.info("Нажмите «Обновить» в боковом меню, чтобы загрузить данные")
-        st.stop()
+@st.cache_resource(show_spinner=False)
+def get_store():
+    return SqlStore(ANALYTICS_DB) if ANALYTICS_DB else DatasetStore()
+
+@st.cache_resource(show_spinner=False)
+def get_refresher():
+    r = Refresher(load_sources, get_store(), REFRESH_INTERVAL_MIN * 60, bootstrap=load_snapshots)
+    r.start()
+    return r
+
+@st.cache_resource(show_spinner=False)
+def get_pivots():
+    return PivotEngine()
+
+store = get_store()
+refresher = get_refresher()
+st.session_state.setdefault("dataset_version", None)
+
+@counted_cache(show_spinner=False, max_entries=8)
+def trend_daily(version: int) -> pd.DataFrame:
+    return store.get(version).daily()
+
+@counted_cache(show_spinner=False, max_entries=8)
+def trend_sources(version: int) -> list:
+    return trend_daily(version)["traffic_source"].unique().tolist()
+
+@counted_cache(show_spinner=False, max_entries=64)
+def trend_json(version: int, sources: tuple, window: str) -> str:
+    """Сериализованная фигура тренда; переключение окна не перестраивает её заново."""
+    with stage("figure.trend"):
+        return trend_figure(trend_daily(version), list(sources), window).to_json()
+
+@counted_cache(show_spinner=False, max_entries=32)
+def top_bayers(version: int, group: str, start, end) -> tuple:
+    with stage("top10", group=group):
+        return store.get(version).top(group, start, end, n=10)
+
+@counted_cache(show_spinner=False, max_entries=16)
+def table_rows(version: int, name: str, start, end, sources: tuple,
+               bayer: str, sort_by, ascending: bool):
+    """Выборка после фильтров и сортировки; сами строки не копируются."""
+    with stage("table.rows", table=name):
+        return store.get(version).select(name, start, end, sources, bayer, sort_by, ascending)
+
+def table_section(ds, name: str):
+    """Таблица с фильтрами и постраничным выводом: в браузер уходит одна страница."""
+    info = ds.table_info(name)
+    if not info["rows"]:
+        st.info("Нет данных")
+        return
 
-    # ---------- дата отчёта и информационный баннер ----------
-    df_m = st.session_state["moloco"].copy()
-    df_m["event_time"] = pd.to_datetime(df_m["event_time"]).dt.date
-    latest  = df_m["event_time"].max()
-    prev_day = latest - timedelta(days=1)
+    col1, col2 = st.columns(2)
+    with col1:
+        start = st.date_input("Начало периода", info["start"].date(), key=f"{name}_start")
+    with col2:
+        end = st.date_input("Конец периода", info["end"].date(), key=f"{name}_end")
 
-    st.info(
-        f"Данные отражают **расходы за прошедший день** — {prev_day:%d %B %Y}.",
-        icon="ℹ️",
-    )
+    col3, col4, col5, col6 = st.columns([2, 2, 2, 1])
+    with col3:
+        all_sources = info["sources"]
+        sources = st.multiselect("Источник", all_sources, key=f"{name}_sources") if len(all_sources) > 1 else []
+    with col4:
+        bayer = st.text_input("Bayer id содержит", key=f"{name}_bayer")
+    with col5:
+        sort_by = st.selectbox("Сортировка", [None, *info["columns"]], key=f"{name}_sort")
+    with col6:
+        ascending = st.toggle("По возр.", True, key=f"{name}_asc")
+
+    rows = table_rows(ds.version, name, start, end, tuple(sources), bayer.strip(), sort_by, ascending)
+
+    col7, col8 = st.columns([1, 3])
+    with col7:
+        size = st.selectbox("Строк на странице", [50, 100, 500, 1000], key=f"{name}_size")
+    pages = max(1, -(-len(rows) // size))
+    with col8:
+        page = st.number_input("Страница", 1, pages, 1, key=f"{name}_page")
+    st.caption(f"Строк: {len(rows):,} · страница {page} из {pages}")
+    page_df = ds.page(name, rows, page - 1, size)
+    if ADMIN_PANEL:
+        observe("payload.dataframe", int(page_df.memory_usage(deep=True).sum()), table=name)
+    st.dataframe(page_df)
+
+    # Выгрузка всего результата: файл пишется частями только по нажатию
+    col9, col10 = st.columns(2)
+    with col9:
+        st.download_button(
+            "Скачать CSV", data=lambda: ds.export(name, rows, "csv"),
+            file_name=f"{name}.csv", mime="text/csv", key=f"{name}_csv",
+        )
+    with col10:
+        st.download_button(
+            "Скачать Parquet", data=lambda: ds.export(name, rows, "parquet"),
+            file_name=f"{name}.parquet", mime="application/octet-stream", key=f"{name}_parquet",
+        )
 
+def pivot_section(ds):
+    """Сводная по дневному кубу: измерения строк и колонок, мера и период."""
+    min_dt, max_dt = (d.date() for d in ds.date_span())
+    col1, col2 = st.columns(2)
+    with col1:
+        start = st.date_input("Начало периода", min_dt, key="pivot_start")
+    with col2:
+        end = st.date_input("Конец периода", max_dt, key="pivot_end")
 
-    # ======================================================================
-    #                          KPI-карточки
-    # ======================================================================
+    col3, col4, col5 = st.columns([2, 2, 1])
+    with col3:
+        rows = st.multiselect("Строки", DIMENSIONS, default=["month"],
+                              format_func=DIMENSION_LABELS.get, key="pivot_rows")
+    with col4:
+        # bayer_id в колонках — тысячи колонок: только в строках
+        cols = st.multiselect("Колонки", [d for d in DIMENSIONS if d != "bayer_id"],
+                              default=["traffic_source"], format_func=DIMENSION_LABELS.get,
+                              key="pivot_cols")
+    with col5:
+        value = st.radio("Мера", ["cost_rub", "cost_usd"], key="pivot_value",
+                         format_func={"cost_rub": "₽", "cost_usd": "$"}.get)
+
+    if not rows:
+        st.warning("Выберите хотя бы одно измерение для строк")
+        return
+    if set(rows) & set(cols):
+        st.error("Измерение не может быть одновременно в строках и в колонках")
+        return
+    if sum(d in TIME_GRAINS for d in rows + cols) > 1:
+        st.error("Выберите одну гранулярность времени: день, неделю или месяц")
+        return
+    if start > end:
+        st.error("Начальная дата позже конечной")
+        return
+
+    spec = PivotSpec(tuple(rows), tuple(cols), value, pd.Timestamp(start), pd.Timestamp(end))
+    with stage("pivot", rows=",".join(rows), cols=",".join(cols)):
+        table = get_pivots().pivot(ds, spec)
+
+    st.caption(f"Строк: {len(table):,} · колонок: {table.shape[1]:,}")
+    if table.size > PIVOT_MAX_CELLS:
+        table = table.head(PIVOT_MAX_CELLS // table.shape[1])
+        st.warning(f"Сводная слишком большая — показаны первые {len(table):,} строк. "
+                   f"Сузьте период или уберите измерение.")
+    if ADMIN_PANEL:
+        observe("payload.dataframe", int(table.memory_usage(deep=True).sum()), table="pivot")
+    st.dataframe(
+        table,
+        column_config={c: st.column_config.NumberColumn(format="localized") for c in table.columns},
+    )
 
-    # Moloco
-    moloco_usd       = df_m.loc[df_m["event_time"] == prev_day, "cost"].map(clean_num).sum()
-    moloco_usd_prev  = df_m.loc[df_m["event_time"] == prev_day - timedelta(days=1), "cost"].map(clean_num).sum()
-    moloco_rub       = moloco_usd * usd_rate if usd_rate else None
-    moloco_rub_prev  = moloco_usd_prev * usd_rate if usd_rate else None
-    delta_moloco_pct = ((moloco_rub - moloco_rub_prev) / moloco_rub_prev * 100) if moloco_rub_prev else 0
+# ────────────────────────────────────────────────────────────────
+#  Секции «Главной»: тренд и TOP-10 — фрагменты, виджеты внутри них
+#  перезапускают только свою секцию, а не весь скрипт
+# ────────────────────────────────────────────────────────────────
+def _fmt_pct(pct) -> tuple:
+    """Подпись и цвет изменения; без базы для сравнения — прочерк."""
+    if pd.isna(pct):
+        return "—", "#a0a0a0"
+    return f"{pct:+.1f}%", "limegreen" if pct >= 0 else "orangered"
+
+@counted_cache(show_spinner=False, max_entries=8)
+def kpi_cards(version: int, day) -> tuple:
+    """
+    KPI-карточки за day: (Moloco, [остальные источники]). Карточка — словарь
+    с source, usd и статистиками rolling.STATS в рублях (день, неделя,
+    месяц к дате, средние за 7 / 30 дней с изменениями к прошлым периодам).
+    """
+    ds = store.get(version)
+    with stage("kpi"):
+        # Рубли — по курсу ЦБ на дату расхода
+        stats = ds.period_stats("traffic_source", day)
+        moloco_usd = ds.day_totals("moloco", [day], "cost_usd").to_numpy().sum()
+        usd_o      = ds.day_totals("other", [day], "cost_usd").iloc[:, 0].sort_index()
+    empty = pd.Series({"day": 0.0, "w7": 0.0, "mtd": 0.0, "avg7": 0.0, "avg30": 0.0})
+
+    def card(src, usd):
+        row = stats.loc[src] if src in stats.index else empty
+        return {"source": src, "usd": usd, **row.to_dict()}
+
+    return card("Moloco", moloco_usd), [card(src, usd) for src, usd in usd_o.items()]
+
+@counted_cache(show_spinner=False, max_entries=8)
+def bayer_periods(version: int, day, n: int = 50) -> pd.DataFrame:
+    """Сравнения периодов по bayer_id: n самых затратных за 7 дней."""
+    with stage("kpi.bayers"):
+        stats = store.get(version).period_stats("bayer_id", day)
+    return stats.nlargest(n, "w7")
+
+def _periods_html(c: dict, size: int) -> str:
+    """Строка под суммой карточки: неделя, месяц к дате и средние."""
+    wow, wow_color = _fmt_pct(c.get("wow_pct"))
+    mom, mom_color = _fmt_pct(c.get("mom_pct"))
+    return (
+        f'<div style="font-size:{size}px;color:#b0b0b0;margin-top:6px;line-height:1.5;">'
+        f'7 дн.: {int(c["w7"]):,}&nbsp;₽ <span style="color:{wow_color};">{wow}</span>'
+        f' · MTD: {int(c["mtd"]):,}&nbsp;₽ <span style="color:{mom_color};">{mom}</span><br>'
+        f'Ср. за 7 / 30 дн.: {int(c["avg7"]):,} / {int(c["avg30"]):,}&nbsp;₽'
+        f'</div>'
+    )
 
+def kpi_section(ds, day):
+    """KPI-карточки за день; суммы — из кэша по (версия, день)."""
+    moloco, cards = kpi_cards(ds.version, day)
+    dod, dod_color = _fmt_pct(moloco.get("dod_pct"))
     st.markdown(
         f"""
         <div style="border:1px solid #505050;border-radius:8px;padding:18px 20px 22px 20px;margin-bottom:22px;">
           <div style="font-size:15px;color:#a0a0a0;margin-bottom:4px;">Moloco</div>
           <div style="font-size:40px;font-weight:600;line-height:1.15;">
-              {int(moloco_rub):,}&nbsp;₽
-              <span style="font-size:15px;color:#b0b0b0;">≈ ${moloco_usd:,.0f}</span>
+              {int(moloco["day"]):,}&nbsp;₽
+              <span style="font-size:15px;color:#b0b0b0;">≈ ${moloco["usd"]:,.0f}</span>
           </div>
-          <div style="color:{'limegreen' if delta_moloco_pct>=0 else 'orangered'};font-size:18px;margin-top:4px;">
-              {delta_moloco_pct:+.1f}%
+          <div style="color:{dod_color};font-size:18px;margin-top:4px;">
+              {dod}
           </div>
+          {_periods_html(moloco, 15)}
         </div>
         """,
         unsafe_allow_html=True,
     )
 
     # Other sources
-    df_o = st.session_state["other"].copy()
-    df_o.columns = (
-        df_o.columns.str.replace(r"\s+", "", regex=True).str.lower()
-    )
-    df_o["event_time"] = pd.to_datetime(df_o["event_date"]).dt.date
-
-    cards = []
-    for src, grp in df_o.groupby("traffic_source"):
-        rub_today = grp.loc[grp["event_time"] == prev_day, "costs"].map(clean_num).sum()
-        rub_prev  = grp.loc[grp["event_time"] == prev_day - timedelta(days=1), "costs"].map(clean_num).sum()
-        usd_today = rub_today / usd_rate if usd_rate else 0
-        delta_pct = ((rub_today - rub_prev) / rub_prev * 100) if rub_prev else 0
-        cards.append((src, rub_today, usd_today, delta_pct))
-
     row_cols = st.columns(3, gap="large")
-    for i, (src, rub, usd, dlt) in enumerate(cards):
+    for i, c in enumerate(cards):
+        dod, dod_color = _fmt_pct(c.get("dod_pct"))
         with row_cols[i % 3]:
             st.markdown(
                 f"""
                 <div style="border:1px solid #505050;border-radius:8px;padding:14px 18px 18px 18px;margin-bottom:18px;">
-                  <div style="font-size:14px;color:#a0a0a0;margin-bottom:4px;">{src}</div>
+                  <div style="font-size:14px;color:#a0a0a0;margin-bottom:4px;">{c["source"]}</div>
                   <div style="font-size:28px;font-weight:600;line-height:1.15;">
-                      {int(rub):,}&nbsp;₽
-                      <span style="font-size:12px;color:#b0b0b0;">≈ ${usd:,.0f}</span>
+                      {int(c["day"]):,}&nbsp;₽
+                      <span style="font-size:12px;color:#b0b0b0;">≈ ${c["usd"]:,.0f}</span>
                   </div>
-                  <div style="color:{'limegreen' if dlt>=0 else 'orangered'};font-size:13px;margin-top:2px;">
-                      {dlt:+.1f}%
+                  <div style="color:{dod_color};font-size:13px;margin-top:2px;">
+                      {dod}
                   </div>
+                  {_periods_html(c, 12)}
                 </div>
                 """,
                 unsafe_allow_html=True,
@@ -190,241 +373,226 @@ if menu == "Главная":
         if (i % 3) == 2 and i != len(cards) - 1:
             row_cols = st.columns(3, gap="large")
 
-    # ────────────────────────────────────────────────────────────────
-    #  Тренд‑график
-    # ────────────────────────────────────────────────────────────────
-    st.divider()
-    st.header("Тренд затрат по источникам")
-
-    # --- подготовка данных ---
-    moloco_df = df_m.copy()
-    moloco_df["cost_usd"] = moloco_df["cost"].map(clean_num)
-    moloco_df["cost_rub"] = moloco_df["cost_usd"] * usd_rate if usd_rate else float("nan")
-    moloco_daily = (
-        moloco_df.groupby("event_time")["cost_rub"].sum().reset_index()
-        .assign(traffic_source="Moloco")
-    )
-
-    df_o["cost_rub"] = df_o["costs"].map(clean_num)
-    other_daily = (
-        df_o.groupby(["event_time", "traffic_source"])["cost_rub"].sum().reset_index()
-    )
+    with st.expander("Bayer id: день, неделя, месяц к дате"):
+        st.dataframe(
+            bayer_periods(ds.version, day),
+            column_config={
+                "day": st.column_config.NumberColumn("День", format="%.0f ₽"),
+                "dod_pct": st.column_config.NumberColumn("К пред. дню", format="%+.1f%%"),
+                "w7": st.column_config.NumberColumn("7 дней", format="%.0f ₽"),
+                "wow_pct": st.column_config.NumberColumn("Неделя к неделе", format="%+.1f%%"),
+                "mtd": st.column_config.NumberColumn("MTD", format="%.0f ₽"),
+                "mom_pct": st.column_config.NumberColumn("К прошлому месяцу", format="%+.1f%%"),
+                "avg7": st.column_config.NumberColumn("Ср. 7 дн.", format="%.0f ₽"),
+                "avg30": st.column_config.NumberColumn("Ср. 30 дн.", format="%.0f ₽"),
+            },
+        )
 
-    chart_df = pd.concat([moloco_daily, other_daily], ignore_index=True)
+@st.fragment
+def trend_section(ds):
+    """Тренд: смена источников или окна перезапускает только этот фрагмент."""
+    with stage("fragment.trend"):
+        st.divider()
+        st.header("Тренд затрат по источникам")
+
+        # --- фильтр источников и окна ---
+        sources_all = trend_sources(ds.version)
+        sel_sources = st.multiselect(
+            "Источники на графике",
+            options=sources_all,
+            default=["Moloco"],
+            key="sel_sources_chart",
+        )
+        if not sel_sources:
+            st.warning("Выберите хотя бы один источник")
+            return
+        window = st.radio(
+            "Период", list(TREND_WINDOWS), index=len(TREND_WINDOWS) - 1,
+            horizontal=True, key="trend_window", label_visibility="collapsed",
+        )
 
-    # ---------- НОВЫЙ БЛОК: убираем неполный последний день ----------
-    latest_dt = chart_df["event_time"].max()
-    chart_df = chart_df[chart_df["event_time"] < latest_dt]
-    # ---------------------------------------------------------------
+        # --- построение: готовая фигура из кэша по (версия, источники, окно) ---
+        fig_json = trend_json(ds.version, tuple(sel_sources), window)
+        if ADMIN_PANEL:
+            observe("payload.plotly_chart", len(fig_json), chart="trend")
+        st.plotly_chart(pio.from_json(fig_json), use_container_width=True)
+
+@st.fragment
+def top10_section(ds):
+    """TOP-10: смена дат пересчитывает только fig1/fig2."""
+    with stage("fragment.top10"):
+        # ── выбор диапазона дат ─────────────────────────────────────
+        min_dt, max_dt = (d.date() for d in ds.date_span())
+        st.divider()
+        st.header("TOP-10 Bayer id по затратам")
+        c_start, c_end = st.columns(2)
+        with c_start:
+            d_start = st.date_input("Начало периода", min_dt, key="top_start")
+        with c_end:
+            d_end = st.date_input("Конец периода", max_dt, key="top_end")
+        if d_start > d_end:
+            st.error("Начальная дата позже конечной")
+            return
+
+        # ── 1) Moloco: TOP-10 по индексу ────────────────────────────
+        moloco_top, _ = top_bayers(ds.version, "moloco", d_start, d_end)
+        # ── 2) Другие источники: stacked TOP-10 ───────────────────
+        tot_o, other_top = top_bayers(ds.version, "other", d_start, d_end)
+
+        with stage("figure.top10"):
+            fig1 = top_bayers_figure(moloco_top, title="Moloco ● TOP-10 Bayer id")
+            fig2 = top_bayers_figure(tot_o, other_top, title="Другие источники ● TOP-10 Bayer id")
+        if ADMIN_PANEL:
+            observe("payload.plotly_chart", len(fig1.to_json()), chart="top10_moloco")
+            observe("payload.plotly_chart", len(fig2.to_json()), chart="top10_other")
+
+        # ── выводим в две колонки ─────────────────────────────────
+        col1, col2 = st.columns(2, gap="large")
+        with col1:
+            st.plotly_chart(fig1, use_container_width=True)
+        with col2:
+            st.plotly_chart(fig2, use_container_width=True)
 
-    # --- фильтр источников ---
-    sources_all = chart_df["traffic_source"].unique().tolist()
-    sel_sources = st.multiselect(
-        "Источники на графике",
-        options=sources_all,
-        default=["Moloco"],
-        key="sel_sources_chart",
-    )
-    if not sel_sources:
-        st.warning("Выберите хотя бы один источник")
-        st.stop()
+# ────────────────────────────────────────────────────────────────
+#  Sidebar
+# ────────────────────────────────────────────────────────────────
+st.sidebar.title("Навигация")
+menu = st.sidebar.radio("", ["Главная", "Диаграммы", "Сводные таблицы", "Табличные данные"])
+st.sidebar.markdown("---")
 
-    chart_df = chart_df[chart_df["traffic_source"].isin(sel_sources)]
+# Курсы из локальной таблицы: без сетевого запроса при рендере
+usd_rate, eur_rate = fx_table.latest()
+st.sidebar.caption(f"USD/RUB: {usd_rate:.2f}" if usd_rate else "USD/RUB: —")
+st.sidebar.caption(f"EUR/RUB: {eur_rate:.2f}" if eur_rate else "EUR/RUB: —")
+st.sidebar.markdown("---")
 
-    # --- построение ---
-    fig = px.line(
-        chart_df,
-        x="event_time",
-        y="cost_rub",
-        color="traffic_source",
-        labels=dict(event_time="Дата", cost_rub="Затраты (₽)", traffic_source="Источник"),
+if st.sidebar.button("Обновить"):
+    # Не ждём загрузку: страница продолжает показывать текущую версию,
+    # сессия перейдёт на новую, когда та будет опубликована
+    refresher.request()
+    st.session_state["follow_latest"] = True
+
+# Сессия читает закреплённую версию: фоновое обновление не меняет данные
+# посреди работы со страницей. На новую версию сессия переходит по кнопке,
+# после «Обновить» или когда закреплённую вытеснили из хранилища
+latest = store.current()
+pinned = st.session_state["dataset_version"]
+if latest and (pinned is None or st.session_state.get("follow_latest") and latest.version > pinned):
+    st.session_state.pop("follow_latest", None)
+    pinned = latest.version
+dataset = store.get(pinned) if latest else None
+if dataset:
+    st.session_state["dataset_version"] = dataset.version
+    if latest.version > dataset.version and st.sidebar.button(
+        f"Показать новые данные (версия {latest.version})", key="advance_version"
+    ):
+        st.session_state["dataset_version"] = latest.version
+        st.rerun()
+    age_min = (datetime.now(MSK) - dataset.loaded_at).total_seconds() // 60
+    age = f"{int(age_min)} мин назад" if age_min < 120 else f"{int(age_min // 60)} ч назад"
+    st.sidebar.caption(dataset.loaded_at.strftime("Обновлено: %Y-%m-%d %H:%M") + f" ({age})")
+    st.sidebar.caption(
+        f"Версия данных: {dataset.version} · "
+        f"{dataset.memory_usage()['total'] / 2**20:,.1f} МБ"
     )
-    fig.update_layout(colorway=px.colors.qualitative.Pastel)
-    fig.update_layout(
-        xaxis=dict(
-            rangeselector=dict(
-                buttons=[
-                    dict(count=7, label="Неделя", step="day", stepmode="backward"),
-                    dict(count=1, label="Месяц", step="month", stepmode="backward"),
-                    dict(step="all", label="Всё"),
-                ]
-            ),
-            rangeslider=dict(visible=True),
-            type="date",
+st.sidebar.caption("✅ Данные загружены" if dataset else "❌ Данные не загружены")
+if refresher.refreshing:
+    st.sidebar.caption("⏳ Идёт обновление данных…")
+elif refresher.last_error is not None:
+    st.sidebar.caption(f"⚠️ Ошибка обновления: {refresher.last_error}")
+
+# Первый прогон сессии после входа: каркас страницы уже отрисован
+if not st.session_state.get("first_paint_done"):
+    st.session_state["first_paint_done"] = True
+    timing("startup.first_paint", (time.perf_counter() - _run_t0) * 1000)
+
+# Панель метрик: этапы, попадания в кэши, размеры payload (secrets ADMIN_PANEL)
+if ADMIN_PANEL:
+    with st.sidebar.expander("Метрики"):
+        st.dataframe(pd.DataFrame(metrics.stages()), hide_index=True)
+        counters = metrics.counters()
+        hits = [
+            {"cache": key[len("cache."):-len(".calls")], "calls": int(calls),
+             "hit_ratio": round(1 - counters.get(key[:-len(".calls")] + ".miss", 0) / calls, 3)}
+            for key, calls in sorted(counters.items())
+            if key.startswith("cache.") and key.endswith(".calls") and calls
+        ]
+        if hits:
+            st.dataframe(pd.DataFrame(hits), hide_index=True)
+        other = {k: v for k, v in counters.items() if not k.startswith("cache.")}
+        if other:
+            st.json(other)
+        if sizes := metrics.sizes():
+            st.json({k: f"{v / 1024:,.1f} КБ" for k, v in sizes.items()})
+        st.download_button(
+            "Prometheus", data=metrics.to_prometheus,
+            file_name="metrics.prom", mime="text/plain", key="metrics_prom",
         )
+
+# ────────────────────────────────────────────────────────────────
+#  Главная
+# ────────────────────────────────────────────────────────────────
+if menu == "Главная":
+    st.title("Dashboard: Затраты рекламы")
+    st.markdown(
+        "Добро пожаловать в дашборд мониторинга затрат по источникам трафика."
     )
-    fig.update_traces(marker=dict(size=4), line=dict(width=2))
-    fig.update_yaxes(tickformat=",.0f")
-
-    st.plotly_chart(fig, use_container_width=True)
-
-
-    # ────────────────────────────────────────────────────────────────
-    #  TOP-10 Bayer id по затратам
-    # ────────────────────────────────────────────────────────────────
-    @st.cache_data(show_spinner=False)
-    def _prepare_bayer_dfs(df_m, df_o, usd_rate):
-        """Унифицируем колонки и пересчитаем cost_rub."""
-        moloco = (
-            df_m.rename(columns={"Bayer id": "bayer_id"})
-            .assign(
-                event_time=lambda d: pd.to_datetime(d["event_time"]).dt.date,
-                bayer_id=lambda d: d["bayer_id"].astype(str),
-                cost_rub=lambda d: d["cost"].map(clean_num) * usd_rate,
-            )
-        )
-        other = (
-            df_o.rename(columns=lambda c: re.sub(r"\s+", "", c).lower())
-            .rename(columns={"bayerid": "bayer_id"})
-            .assign(
-                event_time=lambda d: pd.to_datetime(
-                    d.get("event_date", d["event_time"])
-                ).dt.date,
-                bayer_id=lambda d: d["bayer_id"].astype(str),
-                cost_rub=lambda d: d["costs"].map(clean_num),
-            )
-        )
-        return moloco, other
-
-
-    moloco_all, other_all = _prepare_bayer_dfs(df_m, df_o, usd_rate)
-
-    # ── выбор диапазона дат ─────────────────────────────────────────
-    min_dt = min(moloco_all["event_time"].min(), other_all["event_time"].min())
-    max_dt = max(moloco_all["event_time"].max(), other_all["event_time"].max())
-    st.divider()
-    st.header("TOP-10 Bayer id по затратам")
-    c_start, c_end = st.columns(2)
-    with c_start:
-        d_start = st.date_input("Начало периода", min_dt, key="top_start")
-    with c_end:
-        d_end = st.date_input("Конец периода", max_dt, key="top_end")
-    if d_start > d_end:
-        st.error("Начальная дата позже конечной")
+
+    if not dataset:
+        st.info("Данные загружаются — обновите страницу через минуту")
         st.stop()
 
-    # ── 1) Moloco: агрегируем и берём TOP-10 ────────────────────────
-    moloco_agg = (
-        moloco_all
-        .query("@d_start <= event_time <= @d_end")
-        .groupby("bayer_id", as_index=False)["cost_rub"].sum()
-    )
-    moloco_top = moloco_agg.nlargest(10, "cost_rub").sort_values("cost_rub", ascending=True)
-    ids_m = moloco_top["bayer_id"].tolist()
-
-    fig1 = go.Figure(go.Bar(
-        x=moloco_top["cost_rub"],
-        y=moloco_top["bayer_id"],
-        orientation="h",
-        width=0.6,  # толщина баров
-        marker=dict(line=dict(width=0)),  # без рамки
-    ))
-    fig1.update_layout(
-        title="Moloco ● TOP-10 Bayer id",
-        xaxis_title="Затраты (₽)",
-        yaxis=dict(
-            title="Bayer id",
-            type="category",
-            categoryorder="array",
-            categoryarray=ids_m  # только эти 10
-        ),
-        height=60 * len(ids_m) + 100,
-        margin=dict(l=120, r=20, t=50, b=50),
-    )
-    # ── 2) Другие источники: stacked TOP-10 ───────────────────────
-    other_agg = (
-        other_all
-        .query("@d_start <= event_time <= @d_end")
-        .groupby(["bayer_id", "traffic_source"], as_index=False)["cost_rub"].sum()
-    )
-    tot_o = other_agg.groupby("bayer_id", as_index=False)["cost_rub"].sum()
-    top_ids = tot_o.nlargest(10, "cost_rub")["bayer_id"].tolist()
-    other_top = other_agg[other_agg["bayer_id"].isin(top_ids)]
-    ids_o = tot_o[tot_o["bayer_id"].isin(top_ids)].sort_values("cost_rub")["bayer_id"].tolist()
-
-    fig2 = go.Figure()
-    for src in sorted(other_top["traffic_source"].unique()):
-        df_src = other_top[other_top["traffic_source"] == src]
-        fig2.add_trace(go.Bar(
-            x=df_src["cost_rub"],
-            y=df_src["bayer_id"],
-            name=src,
-            orientation="h",
-            width=0.6,
-            marker=dict(line=dict(width=0)),
-        ))
-    fig2.update_layout(
-        title="Другие источники ● TOP-10 Bayer id",
-        xaxis_title="Затраты (₽)",
-        yaxis=dict(
-            title="Bayer id",
-            type="category",
-            categoryorder="array",
-            categoryarray=ids_o
-        ),
-        barmode="stack",
-        height=60 * len(ids_o) + 100,
-        margin=dict(l=120, r=20, t=50, b=50),
+    # ---------- дата отчёта и информационный баннер ----------
+    # Все виджеты страницы читают срезы дневного куба, а не сырые строки
+    _, latest = dataset.date_span("moloco")
+    prev_day = latest - timedelta(days=1)
+
+    st.info(
+        f"Данные отражают **расходы за прошедший день** — {prev_day:%d %B %Y}.",
+        icon="ℹ️",
     )
 
-    # ── выводим в две колонки ─────────────────────────────────────
-    col1, col2 = st.columns(2, gap="large")
-    with col1:
-        st.plotly_chart(fig1, use_container_width=True)
-    with col2:
-        st.plotly_chart(fig2, use_container_width=True)
+    # Полный прогон страницы. Виджеты тренда и TOP-10 перезапускают только
+    # свой фрагмент: сравните page.main и fragment.* на панели метрик
+    with stage("page.main"):
+        kpi_section(dataset, prev_day)
+        trend_section(dataset)
+        top10_section(dataset)
 
 # -----------------------------------------------------------------
-#  Остальные вкладки-заглушки
+#  Диаграммы: заглушка
 # -----------------------------------------------------------------
 
 elif menu == "Диаграммы":
     st.header("Диаграммы")
     st.info("В разработке")
 
+# -----------------------------------------------------------------
+#  Сводные таблицы: измерения и мера — на выбор, итоги по уровням
+# -----------------------------------------------------------------
 elif menu == "Сводные таблицы":
     st.header("Сводные таблицы")
-    st.info("В разработке")
+
+    if not dataset:
+        st.info("Данные загружаются — обновите страницу через минуту")
+        st.stop()
+
+    pivot_section(dataset)
 
 # -----------------------------------------------------------------
-#  Табличные данные: просмотр и фильтр по дате
+#  Табличные данные: постраничный просмотр с фильтрами
 # -----------------------------------------------------------------
 elif menu == "Табличные данные":
     st.title("Табличные данные из Google Sheets")
 
-    if not st.session_state["loaded"]:
-        st.info("Нажмите «Обновить» в боковом меню для загрузки данных")
+    if not dataset:
+        st.info("Данные загружаются — обновите страницу через минуту")
         st.stop()
 
     # ── 1) Moloco ────────────────────────────────────────────────
     st.subheader("Moloco")
-    df_moloco = st.session_state["moloco"].copy()
-    df_moloco["event_time"] = pd.to_datetime(df_moloco["event_time"]).dt.date
-
-    col1, col2 = st.columns(2)
-    with col1:
-        min_m, max_m = df_moloco["event_time"].min(), df_moloco["event_time"].max()
-        start_m = st.date_input("Начало периода", min_m, key="moloco_start")
-    with col2:
-        end_m = st.date_input("Конец периода", max_m, key="moloco_end")
-
-    mask_m = (df_moloco["event_time"] >= start_m) & (df_moloco["event_time"] <= end_m)
-    st.dataframe(df_moloco.loc[mask_m])
+    table_section(dataset, "moloco")
 
     # ── 2) Other sources ─────────────────────────────────────────
     st.subheader("Other sources")
-    df_other = st.session_state["other"].copy()
-    # В разных таблицах колонка может называться event_date или event_time
-    dt_col = "event_date" if "event_date" in df_other.columns else "event_time"
-    df_other[dt_col] = pd.to_datetime(df_other[dt_col]).dt.date
-
-    col3, col4 = st.columns(2)
-    with col3:
-        min_o, max_o = df_other[dt_col].min(), df_other[dt_col].max()
-        start_o = st.date_input("Начало периода ", min_o, key="other_start")
-    with col4:
-        end_o = st.date_input("Конец периода ", max_o, key="other_end")
-
-    mask_o = (df_other[dt_col] >= start_o) & (df_other[dt_col] <= end_o)
-    st.dataframe(df_other.loc[mask_o])
-
+    table_section(dataset, "other")
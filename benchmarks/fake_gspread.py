@@ -0,0 +1,88 @@
+"""
+Внутрипроцессная замена клиента gspread для бенчмарков.
+
+Поддерживает ровно то, чем пользуется sheets.py: open_by_key, worksheets,
+get_worksheet, get_all_values, batch_get и свойства id / row_count.
+latency — искусственная задержка на каждый запрос (имитация сети).
+"""
+import re
+import threading
+import time
+
+_RANGE = re.compile(r"([A-Z]*)(\d+):([A-Z]*)(\d+)")
+
+
+def _column_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - ord("A") + 1
+    return n - 1
+
+
+class FakeWorksheet:
+    def __init__(self, ws_id: int, title: str, values: list, latency: float = 0.0):
+        self.id = ws_id
+        self.title = title
+        self._values = values
+        self._latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.calls += 1
+        if self._latency:
+            time.sleep(self._latency)
+
+    @property
+    def row_count(self) -> int:
+        # Как в Sheets: сетка листа чуть больше заполненной части
+        return len(self._values) + 1000
+
+    def append_rows(self, rows: list):
+        self._values.extend(rows)
+
+    def get_all_values(self) -> list:
+        self._request()
+        return [list(r) for r in self._values]
+
+    def batch_get(self, ranges: list) -> list:
+        """Диапазоны строк 'a:b' и одной колонки 'Ca:Cb'; пустые ячейки — []."""
+        self._request()
+        out = []
+        for rng in ranges:
+            col, a, _, b = _RANGE.fullmatch(rng).groups()
+            rows = self._values[int(a) - 1:int(b)]
+            if col:
+                i = _column_index(col)
+                out.append([[r[i]] if i < len(r) and r[i] != "" else [] for r in rows])
+            else:
+                out.append([list(r) for r in rows])
+        return out
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets: list):
+        self._worksheets = worksheets
+
+    def worksheets(self) -> list:
+        return list(self._worksheets)
+
+    def get_worksheet(self, index: int):
+        return self._worksheets[index]
+
+
+class FakeClient:
+    def __init__(self, sheets: dict, latency: float = 0.0):
+        """sheets: sheet_id → список вкладок, каждая — список строк с заголовком."""
+        ids = iter(range(1, 10**6))
+        self._sheets = {
+            key: FakeSpreadsheet([
+                FakeWorksheet(next(ids), f"tab{i}", values, latency)
+                for i, values in enumerate(tabs)
+            ])
+            for key, tabs in sheets.items()
+        }
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        return self._sheets[key]
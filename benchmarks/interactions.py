@@ -0,0 +1,132 @@
+"""
+Задержка взаимодействий на «Главной»: полный прогон страницы против
+перезапуска одного фрагмента.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.interactions
+    python -m benchmarks.interactions --rows 1000000 --repeat 10
+
+app.py выполняется через streamlit.testing (AppTest) с фейковым клиентом
+gspread и синтетическими листами; курсы заранее записаны в локальную
+таблицу, так что сеть не нужна. AppTest на каждое действие прогоняет
+скрипт целиком, поэтому за одно действие в реестре metrics появляются оба
+замера: время всего прогона (так обрабатывалось любое взаимодействие без
+фрагментов; KPI уже из кэша) и fragment.<секция> — сколько оно стоит
+теперь, когда в браузере перезапускается только фрагмент.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+_TMP = Path(tempfile.mkdtemp(prefix="bench-ui-"))
+# Пути по умолчанию читаются при импорте модулей приложения
+os.environ.setdefault("SHEETS_SNAPSHOT_DIR", str(_TMP / "sheets"))
+os.environ.setdefault("FX_RATES_PATH", str(_TMP / "fx.parquet"))
+os.environ.setdefault("METRICS_PATH", "")
+
+import pandas as pd  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.fake_gspread import FakeClient  # noqa: E402
+from fx import FX_PATH, FxTable  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+PASSWORD = "bench"
+
+
+def _stub_rates(start, end) -> pd.DataFrame:
+    # Все календарные дни: приложению незачем идти в сеть за сегодняшним курсом
+    return pd.DataFrame({"USD": 90.0, "EUR": 100.0}, index=pd.date_range(start, end))
+
+
+def _start(n_rows: int, timeout: float) -> AppTest:
+    FxTable(FX_PATH, provider=_stub_rates).ensure("2022-12-01", date.today())
+    client = FakeClient(synthetic.sheets(n_rows))
+    mock.patch("gspread.service_account_from_dict", lambda creds: client).start()
+
+    at = AppTest.from_file(str(APP), default_timeout=timeout)
+    at.secrets["google_service_account"] = {}
+    at.secrets["MOLOCO_SHEET_ID"] = "moloco"
+    at.secrets["OTHER_SOURCES_SHEET_ID"] = "other"
+    at.secrets["DASHBOARD_PASSWORD"] = PASSWORD
+    at.run()
+    at.sidebar.text_input(key="login_input").input(PASSWORD).run()
+
+    # Данные грузит фоновый поток: ждём первую версию
+    deadline = time.monotonic() + timeout
+    while not any("✅" in c.value for c in at.sidebar.caption):
+        if time.monotonic() > deadline:
+            raise TimeoutError("dataset was not loaded in time")
+        time.sleep(0.2)
+        at.run()
+    return at
+
+
+def _measure(at: AppTest, actions: list, fragment: str) -> dict:
+    """
+    Средние по серии действий, мс: script — весь прогон скрипта (так
+    обрабатывалось любое взаимодействие без фрагментов), page — тело
+    «Главной», fragment — перезапуск одного фрагмента.
+    """
+    metrics.reset()
+    wall = 0.0
+    for act in actions:
+        widget = act(at)
+        t0 = time.perf_counter()
+        widget.run()
+        wall += time.perf_counter() - t0
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    stages = {s["stage"]: s for s in metrics.stages()}
+    script = round(wall / len(actions) * 1000, 1)
+    frag = stages[f"fragment.{fragment}"]["avg_ms"]
+    return {"runs": len(actions), "script_ms": script, "page_ms": stages["page.main"]["avg_ms"],
+            "fragment_ms": frag, "speedup": round(script / frag, 1) if frag else None}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=300)
+    args = ap.parse_args(argv)
+
+    at = _start(args.rows, args.timeout)
+    start, end = at.date_input(key="top_start").value, at.date_input(key="top_end").value
+    sources = at.multiselect(key="sel_sources_chart").options
+    windows = at.radio(key="trend_window").options
+
+    # Каждое действие меняет вход, чтобы не попадать в кэш предыдущего
+    top10 = [
+        lambda at, i=i: at.date_input(key="top_start").set_value(start + pd.Timedelta(days=7 * (i + 1)))
+        for i in range(args.repeat)
+    ] + [lambda at: at.date_input(key="top_start").set_value(start)]
+    trend = [
+        lambda at, i=i: at.multiselect(key="sel_sources_chart").set_value(sources[: 1 + i % len(sources)])
+        for i in range(1, args.repeat + 1)
+    ] + [
+        lambda at, w=w: at.radio(key="trend_window").set_value(w) for w in windows
+    ]
+
+    results = {
+        "TOP-10: дата начала": _measure(at, top10, "top10"),
+        "Тренд: источники/окно": _measure(at, trend, "trend"),
+    }
+    print(f"{args.rows:,} строк, период {start} — {end}")
+    print(f"  {'взаимодействие':<24} {'скрипт, мс':>11} {'страница, мс':>13} {'фрагмент, мс':>13} {'выигрыш':>8}")
+    for name, r in results.items():
+        print(f"  {name:<24} {r['script_ms']:11.1f} {r['page_ms']:13.1f} "
+              f"{r['fragment_ms']:13.1f} {r['speedup']:7.1f}×")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Бенчмарк конвейера дашборда: загрузка → нормализация → агрегаты → графики.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run                       # 10k и 1M строк
+    python -m benchmarks.run --sizes 10000 10000000
+    python -m benchmarks.run --out benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+Данные — синтетические листы (benchmarks/synthetic.py) за фейковым
+клиентом gspread, курсы — заглушка без сети. Для каждого этапа пишутся
+время (wall, секунды) и пик выделенной памяти (tracemalloc, МБ). Память
+меряется отдельным прогоном: под tracemalloc время искажается в разы.
+В режиме --compare код возврата 1, если этап медленнее базового больше,
+чем на --tolerance.
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from benchmarks.fake_gspread import FakeClient
+from charts import top_bayers_figure, trend_figure
+from cube import daily_by_source
+from fx import FxTable, apply_fx
+from normalize import normalize_moloco, normalize_other
+from sheets import fetch_moloco, fetch_other
+from store import build_dataset
+
+DEFAULT_SIZES = [10_000, 1_000_000]
+
+
+def _stub_rates(start, end) -> pd.DataFrame:
+    days = pd.bdate_range(start, end)
+    return pd.DataFrame({"USD": 90.0, "EUR": 100.0}, index=days)
+
+
+class Stages:
+    """
+    Замер этапов `with stages("имя")`: время (trace=False) или пик памяти
+    сверх уже занятой к началу этапа (trace=True).
+    """
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+        self.results = {}
+
+    def __call__(self, name: str):
+        self._name = name
+        return self
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.reset_peak()
+            self._base, _ = tracemalloc.get_traced_memory()
+        self._t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.trace:
+            _, peak = tracemalloc.get_traced_memory()
+            self.results[self._name] = round((peak - self._base) / 2**20, 2)
+        else:
+            self.results[self._name] = round(time.perf_counter() - self._t0, 4)
+
+
+def pipeline(n_rows: int, trace: bool) -> tuple:
+    client = FakeClient(synthetic.sheets(n_rows))
+    tmp = Path(tempfile.mkdtemp(prefix="bench-"))
+    fx = FxTable(tmp / "fx.parquet", provider=_stub_rates)
+    stages = Stages(trace)
+
+    if trace:
+        tracemalloc.start()
+    try:
+        with stages("fetch_cold"):
+            raw_m = fetch_moloco(client, "moloco", tmp / "sheets")
+            raw_o = fetch_other(client, "other", tmp / "sheets")
+        with stages("fetch_warm"):
+            raw_m = fetch_moloco(client, "moloco", tmp / "sheets")
+            raw_o = fetch_other(client, "other", tmp / "sheets")
+        with stages("normalize"):
+            moloco, other = normalize_moloco(raw_m), normalize_other(raw_o)
+        del raw_m, raw_o
+        with stages("fx"):
+            dates = pd.concat([moloco["event_date"], other["event_date"]])
+            fx.ensure(dates.min(), dates.max())
+            moloco, other = apply_fx(moloco, fx), apply_fx(other, fx)
+        with stages("dataset"):
+            ds = build_dataset(1, datetime.now(timezone.utc), moloco, other)
+        del moloco, other
+
+        cube = ds.cube
+        prev_day = ds.date_span("moloco")[1] - pd.Timedelta(days=1)
+        start, end = cube["event_date"].min(), cube["event_date"].max()
+
+        with stages("kpi"):
+            # Как карточки KPI в app.py: сравнения периодов и дневные итоги в USD
+            ds.period_stats("traffic_source", prev_day)
+            ds.period_stats("bayer_id", prev_day)
+            ds.day_totals("moloco", [prev_day], "cost_usd")
+            ds.day_totals("other", [prev_day], "cost_usd")
+        with stages("trend"):
+            daily = daily_by_source(cube)
+            fig_trend = trend_figure(daily, daily["traffic_source"].unique().tolist(), "Всё")
+        with stages("top10"):
+            top_m, _ = ds.bayer_index["moloco"].top(start, end, n=10)
+            top_o, by_src = ds.bayer_index["other"].top(start, end, n=10)
+        with stages("figures"):
+            fig1 = top_bayers_figure(top_m, title="Moloco")
+            fig2 = top_bayers_figure(top_o, by_src, title="Other")
+            payload = sum(len(f.to_json()) for f in (fig_trend, fig1, fig2))
+    finally:
+        if trace:
+            tracemalloc.stop()
+    return stages.results, ds.memory_usage()["total"], payload
+
+
+def run(n_rows: int) -> dict:
+    print(f"{n_rows:,} строк", flush=True)
+    wall, dataset_bytes, payload = pipeline(n_rows, trace=False)
+    peak, _, _ = pipeline(n_rows, trace=True)
+    stages = {}
+    for name in wall:
+        stages[name] = {"wall_s": wall[name], "peak_mb": peak[name]}
+        print(f"  {name:<12} {wall[name]:9.3f} s  {peak[name]:9.1f} MB", flush=True)
+    return {
+        "stages": stages,
+        "dataset_mb": round(dataset_bytes / 2**20, 2),
+        "figure_payload_kb": round(payload / 1024, 1),
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Этапы, ставшие медленнее базовых больше чем на tolerance (доля)."""
+    regressions = []
+    for size, res in current["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if not base:
+            continue
+        for stage, m in res["stages"].items():
+            b = base["stages"].get(stage)
+            # Этапы короче 10 мс шумят сильнее допуска
+            if b and b["wall_s"] >= 0.01 and m["wall_s"] > b["wall_s"] * (1 + tolerance):
+                regressions.append(f"{size} {stage}: {b['wall_s']:.3f} → {m['wall_s']:.3f} s")
+    return regressions
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    ap.add_argument("--out", type=Path, help="куда записать результаты (JSON)")
+    ap.add_argument("--compare", type=Path, help="базовый файл для сравнения")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    current = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": {str(n): run(n) for n in args.sizes},
+    }
+    if args.out:
+        args.out.write_text(json.dumps(current, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(current, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Холодный старт приложения: импорты и первая отрисовка.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 7 --out benchmarks/startup.json
+    python -m benchmarks.startup --compare benchmarks/startup.json
+
+Каждый замер — отдельный интерпретатор (иначе модули уже в sys.modules):
+app.py выполняется через streamlit.testing (AppTest) с фейковым клиентом
+gspread. Время этапов берётся из реестра metrics:
+  startup.login       — прогон до формы входа;
+  startup.imports     — тяжёлые модули после входа;
+  startup.first_paint — первый прогон после входа до боковой панели.
+Плюс wall-время обоих прогонов AppTest. Пишутся медианы по --repeat
+запускам; --compare работает как в benchmarks.run.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP = Path(__file__).resolve().parent.parent / "app.py"
+PASSWORD = "bench"
+
+
+def child(sheets_path: Path) -> dict:
+    """
+    Один холодный старт в текущем (свежем) процессе. Листы готовит
+    родитель: генератор тянет pandas, а его импорт должен попасть в замер.
+    """
+    from unittest import mock
+
+    from streamlit.testing.v1 import AppTest
+
+    from benchmarks.fake_gspread import FakeClient
+    from metrics import metrics
+
+    # gspread импортируется здесь ради подмены клиента, поэтому его импорт
+    # (~0.1 с) в startup.imports не попадает
+    client = FakeClient(json.loads(sheets_path.read_text(encoding="utf-8")))
+    mock.patch("gspread.service_account_from_dict", lambda creds: client).start()
+
+    at = AppTest.from_file(str(APP), default_timeout=120)
+    at.secrets["google_service_account"] = {}
+    at.secrets["MOLOCO_SHEET_ID"] = "moloco"
+    at.secrets["OTHER_SOURCES_SHEET_ID"] = "other"
+    at.secrets["DASHBOARD_PASSWORD"] = PASSWORD
+
+    t0 = time.perf_counter()
+    at.run()
+    login_wall = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    at.sidebar.text_input(key="login_input").input(PASSWORD).run()
+    auth_wall = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    out = {"login_wall": login_wall, "auth_wall": auth_wall}
+    for s in metrics.stages():
+        if s["stage"].startswith("startup."):
+            out[s["stage"]] = s["last_ms"] / 1000
+    return out
+
+
+def run(n_rows: int, repeat: int) -> dict:
+    from benchmarks import synthetic
+
+    sheets_path = Path(tempfile.mkdtemp(prefix="bench-start-")) / "sheets.json"
+    sheets_path.write_text(json.dumps(synthetic.sheets(n_rows), ensure_ascii=False), encoding="utf-8")
+    samples = []
+    for _ in range(repeat):
+        tmp = tempfile.mkdtemp(prefix="bench-start-")
+        env = dict(
+            os.environ,
+            SHEETS_SNAPSHOT_DIR=str(Path(tmp) / "sheets"),
+            FX_RATES_PATH=str(Path(tmp) / "fx.parquet"),
+            METRICS_PATH="",
+        )
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", str(sheets_path)],
+            env=env, capture_output=True, text=True, check=True,
+            cwd=APP.parent,
+        )
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    stages = {}
+    for name in samples[0]:
+        wall = round(statistics.median(s[name] for s in samples), 4)
+        stages[name] = {"wall_s": wall}
+        print(f"  {name:<20} {wall * 1000:9.1f} ms", flush=True)
+    return {"stages": stages}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=10_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", type=Path, help="куда записать результаты (JSON)")
+    ap.add_argument("--compare", type=Path, help="базовый файл для сравнения")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child)))
+        return 0
+
+    from benchmarks.run import compare
+
+    print(f"холодный старт, медиана {args.repeat} запусков", flush=True)
+    current = {"results": {"startup": run(args.rows, args.repeat)}}
+    if args.out:
+        args.out.write_text(json.dumps(current, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(current, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
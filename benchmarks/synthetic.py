@@ -0,0 +1,68 @@
+"""
+Синтетические листы Moloco и других источников.
+
+Строки повторяют «грязный» формат настоящих таблиц: затраты с пробелами
+(в том числе неразрывными) между разрядами и запятой перед копейками,
+даты то «2024-01-31», то «2024-01-31 00:00:00».
+"""
+import numpy as np
+import pandas as pd
+
+OTHER_SOURCES = ["Google Ads", "Yandex Direct", "VK Ads", "TikTok", "Telegram Ads"]
+
+
+def _money(rng, n: int, max_value: float) -> list:
+    cents = rng.integers(0, int(max_value * 100), n)
+    units, kop = np.divmod(cents, 100)
+    seps = rng.choice([" ", "\u00a0", ""], n, p=[0.6, 0.3, 0.1])
+    out = []
+    for u, k, sep in zip(units.tolist(), kop.tolist(), seps.tolist()):
+        body = f"{u:,}".replace(",", sep)
+        out.append(f"{body},{k:02d}")
+    return out
+
+
+def _dates(rng, n: int, start: str, days: int) -> tuple:
+    day_idx = np.sort(rng.integers(0, days, n))
+    labels = pd.date_range(start, periods=days, freq="D").strftime("%Y-%m-%d").to_numpy()
+    values = labels[day_idx].astype(object)
+    with_time = rng.random(n) < 0.3
+    values[with_time] = values[with_time] + " 00:00:00"
+    return day_idx, values.tolist()
+
+
+def moloco_tabs(n_rows: int, n_tabs: int = 12, n_bayers: int = 5000,
+                days: int = 730, start: str = "2023-01-01", seed: int = 0) -> list:
+    """Вкладки Moloco (по одной на период): [[заголовок], строки...] на вкладку."""
+    rng = np.random.default_rng(seed)
+    day_idx, dates = _dates(rng, n_rows, start, days)
+    cost = _money(rng, n_rows, 5_000)
+    bayer = (rng.integers(1, n_bayers + 1, n_rows)).astype(str).tolist()
+    rows = [list(r) for r in zip(dates, cost, bayer)]
+
+    # Границы вкладок — по периодам дат
+    bounds = np.searchsorted(day_idx, np.linspace(0, days, n_tabs + 1)[1:-1])
+    header = ["event_time", "cost", "Bayer id"]
+    parts = np.split(np.arange(n_rows), bounds)
+    return [[header] + rows[p[0]:p[-1] + 1] if len(p) else [header] for p in parts]
+
+
+def other_tabs(n_rows: int, n_bayers: int = 5000, days: int = 730,
+               start: str = "2023-01-01", seed: int = 1) -> list:
+    """Лист других источников: одна вкладка."""
+    rng = np.random.default_rng(seed)
+    _, dates = _dates(rng, n_rows, start, days)
+    cost = _money(rng, n_rows, 300_000)
+    bayer = (rng.integers(1, n_bayers + 1, n_rows)).astype(str).tolist()
+    source = rng.choice(OTHER_SOURCES, n_rows).tolist()
+    header = ["event_date", "costs", "Bayer id", "traffic_source"]
+    return [[header] + [list(r) for r in zip(dates, cost, bayer, source)]]
+
+
+def sheets(n_rows: int, moloco_share: float = 0.6, seed: int = 0) -> dict:
+    """Обе таблицы на n_rows строк суммарно: sheet_id → вкладки."""
+    n_m = int(n_rows * moloco_share)
+    return {
+        "moloco": moloco_tabs(n_m, seed=seed),
+        "other":  other_tabs(n_rows - n_m, seed=seed + 1),
+    }
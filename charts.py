@@ -0,0 +1,119 @@
+"""
+Построение графиков дашборда.
+
+Тренд затрат рисуется WebGL-трассами (Scattergl), а окно дат и
+прореживание точек применяются на сервере: в браузер уходит не больше
+MAX_POINTS точек на источник при любой длине истории. TOP-N bayer_id —
+горизонтальные бары по результату BayerRangeIndex.top.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+MAX_POINTS = 400
+
+# Окна тренда: подпись кнопки → длина окна (None — вся история)
+TREND_WINDOWS = {
+    "Неделя": pd.DateOffset(days=7),
+    "Месяц":  pd.DateOffset(months=1),
+    "Всё":    None,
+}
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: индексы точек, сохраняющих форму ряда.
+    x — монотонные числа (например, дни), y — значения.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype("float64")
+    y = y.astype("float64")
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    out = np.empty(threshold, dtype=np.intp)
+    out[0], out[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Среднее следующего бакета (для последнего — последняя точка)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def trend_figure(daily: pd.DataFrame, sources, window: str,
+                 max_points: int = MAX_POINTS) -> go.Figure:
+    """
+    daily — event_date, traffic_source, cost_rub (см. cube.daily_by_source).
+    Последний (неполный) день отбрасывается, как и раньше.
+    """
+    latest_dt = daily["event_date"].max()
+    df = daily[(daily["event_date"] < latest_dt) & daily["traffic_source"].isin(sources)]
+    if (offset := TREND_WINDOWS[window]) is not None and not df.empty:
+        df = df[df["event_date"] > df["event_date"].max() - offset]
+
+    fig = go.Figure()
+    colors = px.colors.qualitative.Pastel
+    for i, src in enumerate(sources):
+        s = df[df["traffic_source"] == src].sort_values("event_date")
+        x = s["event_date"].to_numpy()
+        y = s["cost_rub"].to_numpy()
+        idx = lttb(x.astype("datetime64[D]").astype("int64"), y, max_points)
+        fig.add_trace(go.Scattergl(
+            x=x[idx],
+            y=y[idx],
+            name=src,
+            mode="lines",
+            line=dict(width=2, color=colors[i % len(colors)]),
+            hovertemplate="%{x|%d.%m.%Y}: %{y:,.0f} ₽<extra>" + src + "</extra>",
+        ))
+    fig.update_layout(
+        xaxis=dict(title="Дата", type="date"),
+        yaxis=dict(title="Затраты (₽)", tickformat=",.0f"),
+        legend_title_text="Источник",
+    )
+    return fig
+
+
+def top_bayers_figure(totals: pd.DataFrame, breakdown: pd.DataFrame = None,
+                      title: str = "", value: str = "cost_rub") -> go.Figure:
+    """
+    Горизонтальный бар TOP-N bayer_id (см. cube.BayerRangeIndex.top).
+    С breakdown — stacked по traffic_source.
+    """
+    ids = totals["bayer_id"].tolist()
+    bar = dict(
+        orientation="h",
+        width=0.6,  # толщина баров
+        marker=dict(line=dict(width=0)),  # без рамки
+    )
+    fig = go.Figure()
+    if breakdown is None:
+        fig.add_trace(go.Bar(x=totals[value], y=totals["bayer_id"], **bar))
+    else:
+        for src in sorted(breakdown["traffic_source"].unique()):
+            df_src = breakdown[breakdown["traffic_source"] == src]
+            fig.add_trace(go.Bar(x=df_src[value], y=df_src["bayer_id"], name=src, **bar))
+    fig.update_layout(
+        title=title,
+        xaxis_title="Затраты (₽)",
+        yaxis=dict(
+            title="Bayer id",
+            type="category",
+            categoryorder="array",
+            categoryarray=ids,  # только эти N
+        ),
+        barmode="stack",
+        height=60 * len(ids) + 100,
+        margin=dict(l=120, r=20, t=50, b=50),
+    )
+    return fig
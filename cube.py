@@ -0,0 +1,210 @@
+"""
+Дневной куб затрат: (event_date × traffic_source × bayer_id) → cost_usd, cost_rub.
+
+Строится один раз при загрузке данных из нормализованных фреймов
+(см. normalize.py). KPI-карточки, тренд и TOP-N читают срезы куба, а не
+сырые строки: куб на порядки меньше, поэтому перерисовка страницы почти не
+зависит от длины истории.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+KEYS     = ["event_date", "traffic_source", "bayer_id"]
+MEASURES = ["cost_usd", "cost_rub"]
+
+# Гранулярности времени для сводных таблиц: день, неделя (с понедельника), месяц
+TIME_GRAINS = ("date", "week", "month")
+DIMENSIONS  = TIME_GRAINS + ("traffic_source", "bayer_id")
+
+
+def build_daily_cube(*frames: pd.DataFrame) -> pd.DataFrame:
+    """Складывает нормализованные фреймы в один куб, отсортированный по дате."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame({
+            "event_date":     pd.Series(dtype="datetime64[ns]"),
+            "traffic_source": pd.Series(dtype="category"),
+            "bayer_id":       pd.Series(dtype="category"),
+            "cost_usd":       pd.Series(dtype="float64"),
+            "cost_rub":       pd.Series(dtype="float64"),
+        })
+
+    df = pd.DataFrame({
+        "event_date": pd.concat([f["event_date"] for f in frames], ignore_index=True),
+        **{c: pd.Series(union_categoricals([f[c] for f in frames])) for c in KEYS[1:]},
+        **{c: pd.concat([f[c] for f in frames], ignore_index=True) for c in MEASURES},
+    })
+    # min_count=1: валюта, которой нет в исходных данных, остаётся NaN до пересчёта по курсу
+    return (
+        df.groupby(KEYS, observed=True, sort=True)[MEASURES]
+        .sum(min_count=1)
+        .reset_index()
+    )
+
+
+def source_day_totals(cube: pd.DataFrame, days, value: str = "cost_rub") -> pd.DataFrame:
+    """Суммы по источникам за указанные дни: index = traffic_source, columns = days."""
+    days = pd.DatetimeIndex(days)
+    sl = cube[cube["event_date"].isin(days)]
+    out = (
+        sl.groupby(["traffic_source", "event_date"], observed=True)[value].sum()
+        .unstack("event_date")
+    )
+    sources = cube["traffic_source"].unique()
+    return out.reindex(index=sources, columns=days, fill_value=0.0).fillna(0.0)
+
+
+def daily_by_source(cube: pd.DataFrame, value: str = "cost_rub") -> pd.DataFrame:
+    """Дневной ряд по источникам для тренда: event_date, traffic_source, value."""
+    out = cube.groupby(["event_date", "traffic_source"], observed=True)[value].sum().reset_index()
+    out["traffic_source"] = out["traffic_source"].astype(str)
+    return out
+
+
+def time_key(dates: pd.Series, grain: str) -> pd.Series:
+    """Первый день периода grain (см. TIME_GRAINS) для каждой даты."""
+    if grain == "date":
+        return dates
+    if grain == "week":
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit="D")
+    if grain == "month":
+        return dates.dt.to_period("M").dt.start_time.astype(dates.dtype)
+    raise ValueError(f"unknown time grain: {grain}")
+
+
+def rollup(cube: pd.DataFrame, dims, value: str = "cost_rub",
+           start=None, end=None) -> pd.DataFrame:
+    """
+    Суммы value по измерениям dims (см. DIMENSIONS) за [start, end]:
+    колонки dims + value, по строке на непустую комбинацию.
+    """
+    if start is not None or end is not None:
+        dates = cube["event_date"]
+        mask = np.ones(len(cube), dtype=bool)
+        if start is not None:
+            mask &= (dates >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (dates <= pd.Timestamp(end)).to_numpy()
+        cube = cube[mask]
+    keys = [
+        time_key(cube["event_date"], d).rename(d) if d in TIME_GRAINS else cube[d]
+        for d in dims
+    ]
+    out = cube.groupby(keys, observed=True, sort=False)[value].sum().reset_index()
+    for d in dims:
+        if d not in TIME_GRAINS:
+            out[d] = out[d].astype(str)
+    return out
+
+
+class RangeSums:
+    """
+    Суммы по ключам за диапазоны дней без плотной матрицы ключи × дни.
+
+    Записи (ключ, день, вес) упорядочены по (ключ, день), cum — накопленная
+    сумма весов в этом порядке (cum[0] = 0). Записи ключа за дни [j0, j1) —
+    непрерывный участок: его границы находит бинарный поиск, сумма —
+    разность двух элементов cum. Память — O(записей), а не O(ключей × дней);
+    запрос — O(ключей · log записей) на диапазон. tags — необязательная
+    метка записи (например, код источника) в том же порядке.
+    """
+
+    def __init__(self, dates: pd.Series, key_codes: np.ndarray, n_keys: int,
+                 weights: np.ndarray, tags: np.ndarray = None):
+        self.n_keys = n_keys
+        if len(dates):
+            self.days = pd.date_range(dates.min(), dates.max(), freq="D")
+            day_idx = (dates - self.days[0]).dt.days.to_numpy()
+        else:
+            self.days = pd.DatetimeIndex([])
+            day_idx = np.zeros(0, dtype=np.int64)
+        self.width = len(self.days) + 1
+        flat = np.asarray(key_codes, dtype=np.int64) * self.width + day_idx
+        order = np.lexsort((tags, flat)) if tags is not None else np.argsort(flat, kind="stable")
+        self.flat = flat[order]
+        self.tags = tags[order] if tags is not None else None
+        self.cum = np.concatenate([[0.0], np.cumsum(np.nan_to_num(weights)[order])])
+
+    def bounds(self, starts, ends) -> tuple:
+        """Участки записей [lo, hi) каждого ключа за каждый диапазон [start, end]."""
+        j0 = self.days.searchsorted(pd.DatetimeIndex(starts), side="left")
+        j1 = np.maximum(j0, self.days.searchsorted(pd.DatetimeIndex(ends), side="right"))
+        base = np.arange(self.n_keys, dtype=np.int64)[:, None] * self.width
+        return np.searchsorted(self.flat, base + j0), np.searchsorted(self.flat, base + j1)
+
+    def sums(self, starts, ends) -> np.ndarray:
+        """Суммы весов: матрица ключи × диапазоны."""
+        lo, hi = self.bounds(starts, ends)
+        return self.cum[hi] - self.cum[lo]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.flat.nbytes + self.cum.nbytes + (self.tags.nbytes if self.tags is not None else 0))
+
+
+class BayerRangeIndex:
+    """
+    Префиксные суммы дневных затрат по bayer_id (см. RangeSums).
+
+    Строится один раз из куба. Сумма каждого bayer_id за диапазон дат — два
+    бинарных поиска и вычитание, поэтому смена дат в TOP-N стоит
+    O(число bayer_id · log строк), а не полного прохода по строкам. Разбивка
+    по источникам считается только для N победителей — по их строкам куба.
+    """
+
+    def __init__(self, cube: pd.DataFrame, value: str = "cost_rub"):
+        self.value = value
+        bayer_codes, self.bayers = pd.factorize(cube["bayer_id"].astype(str))
+        # Источники по алфавиту — в этом порядке идёт разбивка внутри bayer_id
+        source_codes, self.sources = pd.factorize(cube["traffic_source"].astype(str), sort=True)
+        self.index = RangeSums(
+            cube["event_date"], bayer_codes, len(self.bayers),
+            cube[value].to_numpy(dtype="float64"), tags=source_codes.astype(np.int32),
+        )
+
+    def totals(self, start, end) -> np.ndarray:
+        """Суммы за [start, end] по каждому bayer_id."""
+        return self.index.sums([start], [end])[:, 0]
+
+    def top(self, start, end, n: int = 10):
+        """
+        TOP-N bayer_id за период [start, end].
+
+        Возвращает (totals, breakdown): totals — bayer_id и сумма по возрастанию
+        (порядок категорий для горизонтального бара), breakdown — те же bayer_id
+        в разбивке по traffic_source.
+        """
+        name = self.value
+        lo, hi = (b[:, 0] for b in self.index.bounds([start], [end]))
+        cum = self.index.cum
+        totals = cum[hi] - cum[lo]
+
+        active = np.flatnonzero(totals)
+        if len(active) > n:
+            active = active[np.argpartition(totals[active], -n)[-n:]]
+        active = active[np.argsort(totals[active], kind="stable")]
+
+        top = pd.DataFrame({"bayer_id": self.bayers[active], name: totals[active]})
+
+        # Строки победителей за период: участки [lo, hi) в порядке ранга
+        rows = (np.concatenate([np.arange(a, b) for a, b in zip(lo[active], hi[active])])
+                if len(active) else np.zeros(0, dtype=np.intp))
+        rank = np.repeat(np.arange(len(active)), hi[active] - lo[active])
+        n_src = len(self.sources)
+        pair_sums = np.bincount(
+            rank * n_src + self.index.tags[rows],
+            weights=cum[rows + 1] - cum[rows],
+            minlength=len(active) * n_src,
+        )
+        sel = np.flatnonzero(pair_sums)
+        breakdown = pd.DataFrame({
+            "bayer_id":       self.bayers[active[sel // n_src]],
+            "traffic_source": self.sources[sel % n_src],
+            name:             pair_sums[sel],
+        })
+        return top, breakdown
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes
@@ -0,0 +1,162 @@
+"""
+Исторические курсы ЦБ РФ (USD/RUB, EUR/RUB) по дням.
+
+Курсы хранятся в локальной таблице (Parquet) и докачиваются одним запросом
+на каждый недостающий участок; известные даты повторно не запрашиваются.
+Выходные и праздники заполняются последним опубликованным курсом.
+Пересчёт затрат — векторное сопоставление по дате, а не умножение на один
+сегодняшний курс.
+"""
+import logging
+import os
+import threading
+import xml.etree.ElementTree as ET
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import requests
+
+log = logging.getLogger(__name__)
+
+FX_PATH    = Path(os.getenv("FX_RATES_PATH", ".cache/fx_rates.parquet"))
+CURRENCIES = ["USD", "EUR"]
+
+# Коды валют ЦБ для XML_dynamic.asp
+_CBR_CODES   = {"USD": "R01235", "EUR": "R01239"}
+_CBR_DYNAMIC = "https://www.cbr.ru/scripts/XML_dynamic.asp"
+# Запас назад, чтобы у первого дня диапазона был предыдущий рабочий день
+_LOOKBACK = timedelta(days=14)
+
+
+def cbr_dynamic(start: date, end: date) -> pd.DataFrame:
+    """
+    Провайдер по умолчанию: один запрос к ЦБ на валюту за весь диапазон.
+    Возвращает опубликованные курсы: index = дата (datetime64), колонки USD, EUR.
+    """
+    cols = {}
+    for cur, code in _CBR_CODES.items():
+        resp = requests.get(
+            _CBR_DYNAMIC,
+            params={
+                "date_req1": start.strftime("%d/%m/%Y"),
+                "date_req2": end.strftime("%d/%m/%Y"),
+                "VAL_NM_RQ": code,
+            },
+            timeout=20,
+        )
+        resp.raise_for_status()
+        root = ET.fromstring(resp.content)
+        dates, values = [], []
+        for rec in root.iter("Record"):
+            nominal = float(rec.findtext("Nominal").replace(",", "."))
+            dates.append(pd.Timestamp(pd.to_datetime(rec.get("Date"), format="%d.%m.%Y")))
+            values.append(float(rec.findtext("Value").replace(",", ".")) / nominal)
+        cols[cur] = pd.Series(values, index=pd.DatetimeIndex(dates), dtype="float64")
+    return pd.DataFrame(cols).sort_index()
+
+
+class FxTable:
+    """
+    Таблица дневных курсов с дисковым кэшем.
+
+    В файле хранится сплошной дневной ряд до последнего опубликованного
+    курса; даты после него (курс ещё не вышел) заполняются на лету и не
+    сохраняются, чтобы подтянуть настоящий курс при следующей синхронизации.
+    """
+
+    def __init__(self, path: Path = FX_PATH, provider=cbr_dynamic):
+        self._path = Path(path)
+        self._provider = provider
+        self._lock = threading.Lock()
+        self._rates = self._read()
+
+    def _read(self) -> pd.DataFrame:
+        if self._path.exists():
+            try:
+                return pd.read_parquet(self._path)
+            except Exception:
+                log.exception("fx cache unreadable, starting empty")
+        return pd.DataFrame(columns=CURRENCIES, index=pd.DatetimeIndex([], name="date"), dtype="float64")
+
+    def _write(self, rates: pd.DataFrame):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        rates.to_parquet(tmp)
+        os.replace(tmp, self._path)
+
+    def ensure(self, start, end) -> None:
+        """
+        Докачивает курсы, которых нет в таблице: по одному запросу на
+        недостающий участок до и после известного ряда.
+        """
+        start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+        one = timedelta(days=1)
+        with self._lock:
+            known = self._rates.index
+            # Запас назад нужен только без предыдущего курса в таблице: при
+            # продлении вперёд ffill начинается с последнего сохранённого дня
+            if not len(known):
+                missing = [(start - _LOOKBACK, end)]
+            else:
+                missing = []
+                if start < known[0]:
+                    missing.append((start - _LOOKBACK, known[0] - one))
+                if end > known[-1]:
+                    missing.append((known[-1] + one, end))
+            if not missing:
+                return
+
+            try:
+                fetched = pd.concat([self._provider(lo.date(), hi.date()) for lo, hi in missing])
+            except Exception:
+                # Без сети пересчитываем по уже известным курсам
+                log.exception("fx fetch failed for %s", missing)
+                return
+            if fetched.empty:
+                return
+            merged = pd.concat([self._rates, fetched[CURRENCIES]])
+            merged = merged[~merged.index.duplicated(keep="first")].sort_index()
+            days = pd.date_range(merged.index[0], merged.index[-1], freq="D", name="date")
+            merged = merged.reindex(days).ffill()
+            if merged.equals(self._rates):
+                return
+            self._rates = merged
+            self._write(merged)
+
+    def rates(self, dates) -> pd.DataFrame:
+        """Курсы на каждую дату (ffill после последнего известного, bfill до первого)."""
+        idx = pd.DatetimeIndex(dates).normalize()
+        with self._lock:
+            rates = self._rates
+        if rates.empty:
+            return pd.DataFrame(np.nan, index=idx, columns=CURRENCIES)
+        uniq = idx.unique().sort_values()
+        grid = rates.reindex(rates.index.union(uniq)).ffill().bfill()
+        return grid.reindex(idx)
+
+    def latest(self):
+        """(USD, EUR) на последнюю известную дату или (None, None)."""
+        with self._lock:
+            rates = self._rates
+        if rates.empty:
+            return None, None
+        usd, eur = rates.iloc[-1][CURRENCIES]
+        return float(usd), float(eur)
+
+
+def apply_fx(df: pd.DataFrame, fx: FxTable) -> pd.DataFrame:
+    """
+    Дозаполняет cost_rub / cost_usd по курсу USD на дату строки.
+    Курс сопоставляется по уникальным датам, затем раскладывается по строкам.
+    """
+    if df.empty:
+        return df
+    codes, days = pd.factorize(df["event_date"])
+    usd = fx.rates(days)["USD"].to_numpy()
+    usd = np.where(codes >= 0, usd[codes], np.nan)
+    return df.assign(
+        cost_rub=df["cost_rub"].fillna(pd.Series(df["cost_usd"].to_numpy() * usd, index=df.index)),
+        cost_usd=df["cost_usd"].fillna(pd.Series(df["cost_rub"].to_numpy() / usd, index=df.index)),
+    )
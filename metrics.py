@@ -0,0 +1,173 @@
+"""
+Лёгкая инструментация горячих путей: время этапов, счётчики и размеры.
+
+Один реестр на процесс (модуль импортируется один раз, в отличие от
+app.py, который Streamlit выполняет заново на каждый прогон). События
+копятся в памяти для панели администратора. Запись в JSON-lines файл —
+по желанию: переменная окружения METRICS_PATH. Файл дописывает фоновый
+поток пачками раз в FLUSH_INTERVAL_S, прогоны страниц диск не ждут;
+больше METRICS_MAX_MB — файл уходит в <имя>.1 и начинается заново.
+
+    with stage("fetch.worksheet", sheet=sheet_id):
+        ...
+    incr("cache.trend_json.miss")
+    observe("payload.plotly_chart", len(fig_json), chart="trend")
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+METRICS_PATH     = os.getenv("METRICS_PATH", "")
+METRICS_MAX_MB   = float(os.getenv("METRICS_MAX_MB", "10"))
+FLUSH_INTERVAL_S = 2.0
+
+
+def _rss_mb() -> float:
+    """Текущий RSS процесса; без /proc — пиковый из getrusage; без обоих — NaN."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        pass
+    # Модуль импортируется до формы входа, а resource есть только в Unix
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    # ru_maxrss — в килобайтах, на macOS — в байтах
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform == "darwin" else 1)
+    return kb / 1024
+
+
+class Metrics:
+    def __init__(self, path: str = METRICS_PATH, keep: int = 1000,
+                 max_bytes: int = int(METRICS_MAX_MB * 2**20)):
+        self._path = Path(path) if path else None
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._events = deque(maxlen=keep)
+        self._pending = []
+        self._writer = None
+        self._stages = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        self._counters = defaultdict(float)
+        self._sizes = {}
+
+    def _emit(self, event: dict):
+        event["ts"] = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        with self._lock:
+            self._events.append(event)
+            if self._path is None:
+                return
+            self._pending.append(event)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._flush_loop, name="metrics-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL_S)
+            self.flush()
+
+    def flush(self):
+        """Дописывает накопленные события в файл (с ротацией по размеру)."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            path = self._path
+        if not pending or path is None:
+            return
+        lines = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in pending)
+        with self._write_lock:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if path.exists() and path.stat().st_size > self._max_bytes:
+                    os.replace(path, path.with_name(path.name + ".1"))
+                with path.open("a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError:
+                # Диск недоступен — метрики остаются в памяти
+                with self._lock:
+                    self._path = None
+                    self._pending.clear()
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        """Время этапа (мс) и RSS процесса после него (МБ)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, (time.perf_counter() - t0) * 1000, **labels)
+
+    def timing(self, name: str, ms: float, **labels):
+        """Длительность этапа, измеренная вызывающим кодом (мс)."""
+        with self._lock:
+            agg = self._stages[name]
+            agg["count"] += 1
+            agg["total_ms"] += ms
+            agg["max_ms"] = max(agg["max_ms"], ms)
+            agg["last_ms"] = ms
+        self._emit({"kind": "stage", "name": name, "ms": round(ms, 3),
+                    "rss_mb": round(_rss_mb(), 1), **labels})
+
+    def incr(self, name: str, n: float = 1, **labels):
+        with self._lock:
+            self._counters[name] += n
+        self._emit({"kind": "counter", "name": name, "value": n, **labels})
+
+    def observe(self, name: str, value: float, **labels):
+        """Разовое значение (например, размер payload в байтах)."""
+        key = name + "".join(f"|{k}={v}" for k, v in sorted(labels.items()))
+        with self._lock:
+            self._sizes[key] = value
+        self._emit({"kind": "size", "name": name, "value": value, **labels})
+
+    def stages(self) -> list:
+        with self._lock:
+            return [
+                {"stage": k, "count": v["count"], "last_ms": round(v["last_ms"], 1),
+                 "avg_ms": round(v["total_ms"] / v["count"], 1), "max_ms": round(v["max_ms"], 1)}
+                for k, v in sorted(self._stages.items())
+            ]
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def sizes(self) -> dict:
+        with self._lock:
+            return dict(self._sizes)
+
+    def reset(self):
+        """Обнуляет накопленные агрегаты (например, между сериями замеров)."""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._sizes.clear()
+
+    def to_prometheus(self) -> str:
+        """Снимок в текстовом формате Prometheus."""
+        lines = ["# TYPE dashboard_stage_ms summary"]
+        for s in self.stages():
+            lines.append(f'dashboard_stage_ms_count{{stage="{s["stage"]}"}} {s["count"]}')
+            lines.append(f'dashboard_stage_ms_sum{{stage="{s["stage"]}"}} {s["avg_ms"] * s["count"]:.1f}')
+        lines.append("# TYPE dashboard_counter_total counter")
+        for name, value in sorted(self.counters().items()):
+            lines.append(f'dashboard_counter_total{{name="{name}"}} {value:g}')
+        lines.append(f"dashboard_rss_mb {_rss_mb():.1f}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+stage = metrics.stage
+timing = metrics.timing
+incr = metrics.incr
+observe = metrics.observe
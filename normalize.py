@@ -0,0 +1,110 @@
+"""
+Единый этап типизации сырых строк из Google Sheets.
+
+Выполняется один раз на загрузку данных; все страницы дашборда читают уже
+типизированные фреймы с общей схемой:
+
+    event_date      datetime64[ns], день события
+    traffic_source  category
+    bayer_id        category
+    cost_usd        float64 (для Moloco — исходная валюта)
+    cost_rub        float64 (для других источников — исходная валюта)
+
+Вторая валюта заполняется NaN и пересчитывается по курсу на дату
+(см. fx.apply_fx).
+Прочие колонки листа сохраняются как есть.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Приведённое имя колонки (без пробелов, в нижнем регистре) → имя в схеме
+_ALIASES = {
+    "event_time": "event_date",
+    "event_date": "event_date",
+    "bayerid":    "bayer_id",
+    "bayer_id":   "bayer_id",
+    "cost":       "cost",
+    "costs":      "cost",
+}
+
+SCHEMA = ["event_date", "traffic_source", "bayer_id", "cost_usd", "cost_rub"]
+
+# Разделители разрядов: \s строк pyarrow (тип str в pandas 3) не совпадает
+# с неразрывными пробелами, а листы в русской локали ставят именно их
+_SPACES = "[\\s\u00a0\u2007\u2009\u202f]+"
+
+
+def _canon(col: str) -> str:
+    key = re.sub(r"\s+", "", str(col)).lower()
+    return _ALIASES.get(key, key)
+
+
+def parse_money(s: pd.Series) -> pd.Series:
+    """'1 234,56' → 1234.56; пробелы (включая неразрывные) убираются, запятая — десятичный разделитель."""
+    t = (
+        s.astype(str)
+        .str.replace(_SPACES, "", regex=True)
+        .str.replace(",", ".", regex=False)
+    )
+    return pd.to_numeric(t, errors="coerce").astype("float64")
+
+
+def parse_dates(s: pd.Series) -> pd.Series:
+    """
+    Парсит даты по уникальным значениям: в листах тысячи строк на день, так
+    что строк для разбора на порядки меньше, чем записей.
+    """
+    codes, uniques = pd.factorize(s, sort=False)
+    uniques = pd.Index(uniques).astype(str)
+    try:
+        parsed = pd.to_datetime(uniques, format="ISO8601")
+    except (ValueError, TypeError):
+        parsed = pd.to_datetime(uniques, format="mixed")
+    parsed = parsed.normalize()
+    out = parsed.take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(np.asarray(out, dtype="datetime64[ns]"), index=s.index)
+
+
+def _normalize(raw: pd.DataFrame, currency: str, default_source: str) -> pd.DataFrame:
+    if raw.empty:
+        return pd.DataFrame({
+            "event_date":     pd.Series(dtype="datetime64[ns]"),
+            "traffic_source": pd.Series(dtype="category"),
+            "bayer_id":       pd.Series(dtype="category"),
+            "cost_usd":       pd.Series(dtype="float64"),
+            "cost_rub":       pd.Series(dtype="float64"),
+        })
+
+    df = raw.copy()
+    df.columns = [_canon(c) for c in df.columns]
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    if "traffic_source" not in df.columns:
+        df["traffic_source"] = default_source
+    if "bayer_id" not in df.columns:
+        df["bayer_id"] = ""
+
+    cost = parse_money(df.pop("cost"))
+    nan = pd.Series(np.nan, index=df.index, dtype="float64")
+    df["cost_usd"] = cost if currency == "USD" else nan
+    df["cost_rub"] = cost if currency == "RUB" else nan.copy()
+
+    df["event_date"] = parse_dates(df["event_date"])
+    df["traffic_source"] = df["traffic_source"].astype(str).str.strip().astype("category")
+    df["bayer_id"] = df["bayer_id"].astype(str).str.strip().astype("category")
+
+    rest = [c for c in df.columns if c not in SCHEMA]
+    return df[SCHEMA + rest]
+
+
+def normalize_moloco(raw: pd.DataFrame) -> pd.DataFrame:
+    """Moloco: event_time / cost (USD) / Bayer id."""
+    return _normalize(raw, "USD", "Moloco")
+
+
+def normalize_other(raw: pd.DataFrame) -> pd.DataFrame:
+    """Другие источники: event_date или event_time / costs (₽) / bayer id."""
+    return _normalize(raw, "RUB", "Other")
+
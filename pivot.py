@@ -0,0 +1,224 @@
+"""
+Сводные таблицы по дневному кубу.
+
+Сводная задаётся PivotSpec: измерения строк и колонок (день / неделя /
+месяц, traffic_source, bayer_id), мера (cost_rub / cost_usd) и период.
+PivotEngine считает её из агрегата версии данных (Dataset.rollup — куб в
+памяти или GROUP BY в SQLite) и хранит:
+
+  * готовые сводные — LRU по (версия, спецификация);
+  * агрегаты — LRU по (версия, мера, период, измерения). Новая сводная
+    берёт самый маленький уже посчитанный агрегат, из которого выводятся
+    её измерения (день → неделя → месяц; лишние измерения просто
+    суммируются), поэтому смена одного измерения не идёт в куб заново.
+
+Матрица, промежуточные итоги по уровням и общие итоги считаются
+np.bincount по кодам измерений — без повторных groupby.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from cube import DIMENSIONS, MEASURES, TIME_GRAINS, time_key
+from metrics import incr
+
+TOTAL = "Итого"
+MAX_PIVOTS = 32
+MAX_ROLLUPS = 16
+
+DIMENSION_LABELS = {
+    "date":           "День",
+    "week":           "Неделя",
+    "month":          "Месяц",
+    "traffic_source": "Источник",
+    "bayer_id":       "Bayer id",
+}
+
+# Из какой гранулярности времени выводится каждая
+_DERIVABLE = {"date": {"date", "week", "month"}, "week": {"week"}, "month": {"month"}}
+
+
+@dataclass(frozen=True)
+class PivotSpec:
+    rows: tuple
+    cols: tuple = ()
+    value: str = "cost_rub"
+    start: pd.Timestamp = None
+    end: pd.Timestamp = None
+
+    def __post_init__(self):
+        dims = self.rows + self.cols
+        if not self.rows:
+            raise ValueError("pivot needs at least one row dimension")
+        if len(set(dims)) != len(dims) or not set(dims) <= set(DIMENSIONS):
+            raise ValueError(f"bad pivot dimensions: {dims}")
+        if sum(d in TIME_GRAINS for d in dims) > 1:
+            raise ValueError("pivot can use only one time dimension")
+        if self.value not in MEASURES:
+            raise ValueError(f"unknown measure: {self.value}")
+
+    @property
+    def dims(self) -> tuple:
+        return self.rows + self.cols
+
+
+def _covers(have: tuple, need: tuple) -> bool:
+    """Выводятся ли измерения need из агрегата по have."""
+    have_time = next((d for d in have if d in TIME_GRAINS), None)
+    for d in need:
+        if d in TIME_GRAINS:
+            if have_time is None or d not in _DERIVABLE[have_time]:
+                return False
+        elif d not in have:
+            return False
+    return True
+
+
+def _derive(agg: pd.DataFrame, dim: str) -> pd.Series:
+    if dim in agg:
+        return agg[dim]
+    # Более крупный период из более мелкого (см. _covers)
+    source = next(d for d in TIME_GRAINS if d in agg)
+    return time_key(agg[source], dim)
+
+
+def _label(values: np.ndarray, dim: str) -> np.ndarray:
+    if dim in TIME_GRAINS:
+        fmt = "%Y-%m" if dim == "month" else "%Y-%m-%d"
+        return pd.DatetimeIndex(values).strftime(fmt).to_numpy(dtype=object)
+    return np.asarray(values, dtype=object)
+
+
+def _encode(agg: pd.DataFrame, dims: tuple):
+    """
+    Коды комбинаций измерений по строкам агрегата.
+
+    Возвращает (code, keys): code — номер комбинации для каждой строки agg,
+    keys — по уровню на измерение: код значения и подпись для каждой
+    комбинации. Комбинации упорядочены лексикографически по значениям.
+    """
+    if not dims:
+        return np.zeros(len(agg), dtype=np.intp), []
+    level_codes, level_labels = [], []
+    for d in dims:
+        codes, uniques = pd.factorize(_derive(agg, d), sort=True)
+        level_codes.append(codes)
+        level_labels.append(_label(np.asarray(uniques), d))
+    sizes = [len(lab) for lab in level_labels]
+    flat = np.ravel_multi_index(level_codes, sizes) if len(agg) else np.zeros(0, dtype=np.intp)
+    code, combos = pd.factorize(flat, sort=True)
+    combo_codes = np.unravel_index(combos, sizes)
+    keys = [(c, lab[c]) for c, lab in zip(combo_codes, level_labels)]
+    return code, keys
+
+
+def _with_subtotals(matrix: np.ndarray, keys: list):
+    """
+    Добавляет к строкам matrix промежуточные итоги по каждому префиксу
+    измерений и общий итог. Возвращает (matrix, labels) — подписи по уровням,
+    строки в порядке: дочерние, затем их итог; общий итог последним.
+    """
+    n, depth = matrix.shape[0], len(keys)
+    blocks = [matrix]
+    sort_keys = [[c for c, _ in keys]]
+    labels = [[lab for _, lab in keys]]
+    # Итоги по префиксам длины 1..depth-1: группы — уникальные префиксы кодов
+    for k in range(1, depth):
+        codes = [c for c, _ in keys[:k]]
+        prefix = np.ravel_multi_index(codes, [c.max() + 1 for c in codes])
+        _, first, group = np.unique(prefix, return_index=True, return_inverse=True)
+        sub = np.zeros((len(first), matrix.shape[1]))
+        np.add.at(sub, group, matrix)
+        blocks.append(sub)
+        # После дочерних строк: на уровнях глубже префикса — код больше любого
+        sort_keys.append([c[first] for c in codes] + [np.full(len(first), n)] * (depth - k))
+        labels.append([lab[first] for _, lab in keys[:k]]
+                      + [np.full(len(first), TOTAL, dtype=object)]
+                      + [np.full(len(first), "", dtype=object)] * (depth - k - 1))
+    blocks.append(matrix.sum(axis=0, keepdims=True))
+    sort_keys.append([np.array([n + 1])] * depth)
+    labels.append([np.array([TOTAL], dtype=object)] + [np.array([""], dtype=object)] * (depth - 1))
+
+    out = np.vstack(blocks)
+    levels = [np.concatenate([sk[i] for sk in sort_keys]) for i in range(depth)]
+    order = np.lexsort(levels[::-1])
+    return out[order], [np.concatenate([lab[i] for lab in labels])[order] for i in range(depth)]
+
+
+def pivot_table(agg: pd.DataFrame, spec: PivotSpec) -> pd.DataFrame:
+    """Сводная по агрегату, из которого выводятся измерения spec (см. _covers)."""
+    names = [DIMENSION_LABELS[d] for d in spec.rows]
+    if agg.empty:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[]] * len(names), names=names))
+    row_code, row_keys = _encode(agg, spec.rows)
+    col_code, col_keys = _encode(agg, spec.cols)
+    n_rows = len(row_keys[0][0]) if row_keys else 1
+    n_cols = len(col_keys[0][0]) if col_keys else 1
+    values = agg[spec.value].to_numpy(dtype="float64")
+    matrix = np.bincount(
+        row_code * n_cols + col_code, weights=np.nan_to_num(values), minlength=n_rows * n_cols
+    ).reshape(n_rows, n_cols)
+
+    matrix, row_labels = _with_subtotals(matrix, row_keys)
+    if col_keys:
+        matrix_t, col_labels = _with_subtotals(matrix.T, col_keys)
+        matrix = matrix_t.T
+        columns = [" · ".join(p for p in parts if p) for parts in zip(*col_labels)]
+    else:
+        columns = [TOTAL]
+
+    index = pd.MultiIndex.from_arrays(row_labels, names=names)
+    return pd.DataFrame(matrix, index=index, columns=columns)
+
+
+class PivotEngine:
+    """Потокобезопасный кэш сводных и агрегатов; один на процесс."""
+
+    def __init__(self, max_pivots: int = MAX_PIVOTS, max_rollups: int = MAX_ROLLUPS):
+        self._lock = threading.Lock()
+        self._pivots = OrderedDict()
+        self._rollups = OrderedDict()
+        self._max_pivots = max_pivots
+        self._max_rollups = max_rollups
+
+    @staticmethod
+    def _lru_put(cache: OrderedDict, key, value, limit: int):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _rollup(self, ds, spec: PivotSpec) -> pd.DataFrame:
+        scope = (ds.version, spec.value, spec.start, spec.end)
+        with self._lock:
+            candidates = [
+                (len(agg), key) for key, agg in self._rollups.items()
+                if key[:4] == scope and _covers(key[4], spec.dims)
+            ]
+            if candidates:
+                key = min(candidates)[1]
+                self._rollups.move_to_end(key)
+                incr("pivot.rollup.reuse")
+                return self._rollups[key]
+        incr("pivot.rollup.query")
+        agg = ds.rollup(spec.dims, spec.value, spec.start, spec.end)
+        with self._lock:
+            self._lru_put(self._rollups, scope + (spec.dims,), agg, self._max_rollups)
+        return agg
+
+    def pivot(self, ds, spec: PivotSpec) -> pd.DataFrame:
+        """Сводная для версии ds; повторный запрос — из кэша."""
+        key = (ds.version, spec)
+        with self._lock:
+            if key in self._pivots:
+                self._pivots.move_to_end(key)
+                incr("pivot.hit")
+                return self._pivots[key]
+        incr("pivot.miss")
+        out = pivot_table(self._rollup(ds, spec), spec)
+        with self._lock:
+            self._lru_put(self._pivots, key, out, self._max_pivots)
+        return out
@@ -0,0 +1,91 @@
+"""
+Фоновое обновление данных (stale-while-revalidate).
+
+Один поток на процесс по расписанию синхронизирует листы и публикует новую
+версию в DatasetStore. Пока идёт загрузка, страницы продолжают показывать
+предыдущую версию; рендер никогда не ждёт Google Sheets. Параллельные
+запросы обновления из разных сессий сливаются в одну загрузку.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+
+log = logging.getLogger(__name__)
+
+
+class Refresher:
+    """
+    load — функция без аргументов, возвращающая (moloco, other, loaded_at):
+    нормализованные фреймы и момент, на который актуальны данные.
+    bootstrap — такая же функция для первой версии из локального снимка,
+    без обращения к сети; возвращает None, если снимка нет.
+    """
+
+    def __init__(self, load, store, interval_s: float, bootstrap=None):
+        self._load = load
+        self._bootstrap = bootstrap
+        self._store = store
+        self._interval = interval_s
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._thread = None
+        self.last_error = None
+        self.last_attempt = None
+
+    @property
+    def refreshing(self) -> bool:
+        with self._lock:
+            return self._inflight is not None
+
+    def request(self) -> threading.Event:
+        """
+        Запускает обновление, если оно ещё не идёт, и возвращает событие его
+        завершения. Повторные вызовы во время загрузки получают то же событие.
+        """
+        with self._lock:
+            if self._inflight is None:
+                self._inflight = threading.Event()
+                threading.Thread(
+                    target=self._run, args=(self._inflight,),
+                    name="dataset-refresh", daemon=True,
+                ).start()
+            return self._inflight
+
+    def _run(self, done: threading.Event):
+        self.last_attempt = datetime.now().astimezone()
+        try:
+            moloco, other, loaded_at = self._load()
+            self._store.publish(moloco, other, loaded_at=loaded_at)
+            self.last_error = None
+        except Exception as e:  # поток не должен падать: повторим по расписанию
+            log.exception("dataset refresh failed")
+            self.last_error = e
+        finally:
+            with self._lock:
+                self._inflight = None
+            done.set()
+
+    def start(self):
+        """Запускает планировщик; первое обновление — сразу."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="dataset-scheduler", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        if self._bootstrap and self._store.current() is None:
+            try:
+                if (snap := self._bootstrap()) is not None:
+                    moloco, other, loaded_at = snap
+                    self._store.publish(moloco, other, loaded_at=loaded_at)
+            except Exception:
+                log.exception("snapshot bootstrap failed")
+        # Общее хранилище (sqlstore) могло обновить другое приложение или
+        # прошлый запуск: свежую версию не перезагружаем до конца интервала
+        if (ds := self._store.current()) is not None:
+            age = (datetime.now(ds.loaded_at.tzinfo) - ds.loaded_at).total_seconds()
+            if 0 <= age < self._interval:
+                time.sleep(self._interval - age)
+        while True:
+            self.request().wait()
+            time.sleep(self._interval)
@@ -0,0 +1,94 @@
+"""
+Скользящие сравнения периодов для KPI: день к дню, неделя к неделе,
+месяц к дате (MTD) и средние за 7 / 30 дней — по источникам и по bayer_id.
+
+RollingStats держит накопленные суммы дневных рядов ключей (cube.RangeSums,
+как у cube.BayerRangeIndex). Сумма за любой период — разность двух
+элементов, поэтому все периоды из periods() считаются одним поиском границ:
+новые периоды в карточках не добавляют проходов по данным. Ряды строятся
+из куба каждой версии заново — это одна сортировка куба.
+"""
+import numpy as np
+import pandas as pd
+
+from cube import RangeSums
+
+# Подписи статистик period_stats (колонки результата)
+STATS = ["day", "dod_pct", "w7", "wow_pct", "mtd", "mom_pct", "avg7", "avg30"]
+
+
+def periods(day) -> dict:
+    """Периоды сравнения для дня day: имя → (первый, последний день) включительно."""
+    d = pd.Timestamp(day).normalize()
+    one = pd.Timedelta(days=1)
+    month_start = d.replace(day=1)
+    prev_month_start = month_start - pd.DateOffset(months=1)
+    # Тот же отрезок прошлого месяца; 31-е в коротком месяце — до его конца
+    prev_mtd_end = min(prev_month_start + (d - month_start), month_start - one)
+    return {
+        "day":      (d, d),
+        "prev_day": (d - one, d - one),
+        "w7":       (d - 6 * one, d),
+        "w7_prev":  (d - 13 * one, d - 7 * one),
+        "d30":      (d - 29 * one, d),
+        "mtd":      (month_start, d),
+        "mtd_prev": (prev_month_start, prev_mtd_end),
+    }
+
+
+def _pct(cur: np.ndarray, prev: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(prev != 0, (cur - prev) / prev * 100, np.nan)
+
+
+def derive_stats(sums: pd.DataFrame) -> pd.DataFrame:
+    """
+    Статистики STATS из сумм по периодам (колонки — ключи periods()).
+    Ключи без затрат во всех периодах опускаются.
+    """
+    sums = sums[(sums.to_numpy() != 0).any(axis=1)]
+    s = {k: sums[k].to_numpy(dtype="float64") for k in sums.columns}
+    return pd.DataFrame({
+        "day":     s["day"],
+        "dod_pct": _pct(s["day"], s["prev_day"]),
+        "w7":      s["w7"],
+        "wow_pct": _pct(s["w7"], s["w7_prev"]),
+        "mtd":     s["mtd"],
+        "mom_pct": _pct(s["mtd"], s["mtd_prev"]),
+        "avg7":    s["w7"] / 7,
+        "avg30":   s["d30"] / 30,
+    }, index=sums.index)
+
+
+class RollingStats:
+    """Накопленные дневные суммы value по ключу key (traffic_source или bayer_id)."""
+
+    def __init__(self, cube: pd.DataFrame, key: str, value: str = "cost_rub"):
+        self.key = key
+        self.value = value
+        # Коды по категориям куба, без перевода миллиона строк в str; ключи —
+        # по алфавиту (как в SQL), а не в порядке категорий
+        codes, keys = pd.factorize(cube[key])
+        keys = np.asarray(keys).astype(str)
+        order = np.argsort(keys, kind="stable")
+        rank = np.empty(len(keys), dtype=np.int64)
+        rank[order] = np.arange(len(keys))
+        self.keys = pd.Index(keys[order], dtype=object)
+        self.index = RangeSums(cube["event_date"], rank[codes], len(self.keys),
+                               cube[value].to_numpy(dtype="float64"))
+
+    def sums(self, spans: dict) -> pd.DataFrame:
+        """Суммы по ключам за каждый период spans (имя → (начало, конец))."""
+        starts = [pd.Timestamp(a) for a, _ in spans.values()]
+        ends = [pd.Timestamp(b) for _, b in spans.values()]
+        return pd.DataFrame(self.index.sums(starts, ends), index=self.keys, columns=list(spans))
+
+    def stats(self, day) -> pd.DataFrame:
+        """STATS по ключам на день day (см. derive_stats)."""
+        out = derive_stats(self.sums(periods(day)))
+        out.index.name = self.key
+        return out
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes
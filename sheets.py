@@ -0,0 +1,327 @@
+"""
+Инкрементальная загрузка листов Google Sheets с локальным снимком на диске.
+
+Листы append-only: каждый день в конец дописываются новые строки. Поэтому
+для каждого листа храним снимок (Parquet + JSON с метаданными) и при
+синхронизации докачиваем только строки, появившиеся после последней
+загрузки. Правки старых строк ловятся по хэшам колонки затрат: снимок
+хранит хэш каждых CHUNK_ROWS строк, синхронизация читает эту колонку и
+перекачивает лист начиная с первого разошедшегося блока. Полная
+перезагрузка листа происходит, если:
+  * снимка ещё нет;
+  * изменился заголовок или первая строка данных;
+  * с прошлой полной загрузки прошло больше FULL_RELOAD_HOURS часов —
+    страховка для правок в колонках, которые хэши не покрывают.
+"""
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+from gspread.exceptions import APIError
+
+from metrics import incr, stage
+
+SNAPSHOT_DIR = Path(os.getenv("SHEETS_SNAPSHOT_DIR", ".cache/sheets"))
+MAX_WORKERS  = int(os.getenv("SHEETS_MAX_WORKERS", "4"))
+MAX_RETRIES  = 5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHUNK_ROWS   = 1000
+# 0 — без принудительных полных перезагрузок
+FULL_RELOAD_HOURS = float(os.getenv("SHEETS_FULL_RELOAD_HOURS", "24"))
+# Колонка для проверки правок — затраты (заголовки как в normalize._ALIASES);
+# если её нет, проверяется первая колонка
+CHECK_HEADERS = ("cost", "costs")
+
+
+# ────────────────────────────────────────────────────────────────
+#  Квота Sheets API: повтор с экспоненциальной задержкой
+# ────────────────────────────────────────────────────────────────
+def with_backoff(fn, *args, retries: int = MAX_RETRIES, base: float = 1.0, **kwargs):
+    """Вызывает fn, повторяя при 429/5xx с задержкой base·2^n + джиттер."""
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except APIError as e:
+            status = getattr(e, "code", None) or getattr(e.response, "status_code", None)
+            if status not in RETRY_STATUS or attempt == retries:
+                raise
+            time.sleep(base * 2 ** attempt + random.uniform(0, base))
+
+
+# ────────────────────────────────────────────────────────────────
+#  Снимок на диске
+# ────────────────────────────────────────────────────────────────
+MANIFEST = "manifest.json"
+
+
+def _paths(sheet_id: str, ws_id: int, root: Path) -> tuple[Path, Path]:
+    base = root / sheet_id
+    return base / f"{ws_id}.parquet", base / f"{ws_id}.json"
+
+
+def write_manifest(sheet_id: str, ws_ids: list, root: Path = SNAPSHOT_DIR) -> None:
+    """
+    Запоминает, из каких листов (в порядке вкладок) состоит таблица, и
+    удаляет снимки остальных — удалённых вкладок или не нужных дашборду.
+    """
+    base = root / sheet_id
+    base.mkdir(parents=True, exist_ok=True)
+    keep = {str(i) for i in ws_ids}
+    for path in base.iterdir():
+        if path.name != MANIFEST and path.suffix in (".parquet", ".json") and path.stem not in keep:
+            path.unlink(missing_ok=True)
+    path = base / MANIFEST
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps({"worksheets": list(ws_ids)}), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _trim(row: list) -> list:
+    """Срезаем пустые ячейки в конце строки — API их не возвращает."""
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _pad(rows: list, width: int) -> list:
+    return [(r + [""] * (width - len(r)))[:width] for r in rows]
+
+
+def _check_column(header: list) -> int:
+    names = ["".join(str(h).split()).lower() for h in header]
+    return next((i for i, h in enumerate(names) if h in CHECK_HEADERS), 0)
+
+
+def _column_letter(i: int) -> str:
+    """Номер колонки (с нуля) → буквы A1-нотации: 0 → A, 26 → AA."""
+    out = ""
+    i += 1
+    while i:
+        i, r = divmod(i - 1, 26)
+        out = chr(ord("A") + r) + out
+    return out
+
+
+def _chunk_hashes(values: list) -> list:
+    """Хэш каждых CHUNK_ROWS значений колонки (последний блок — неполный)."""
+    return [
+        hashlib.blake2b("\x1f".join(values[i:i + CHUNK_ROWS]).encode(), digest_size=8).hexdigest()
+        for i in range(0, len(values), CHUNK_ROWS)
+    ]
+
+
+def _frame(rows: list, header: list) -> pd.DataFrame:
+    """Строит DataFrame сразу по колонкам, без промежуточных dict на строку."""
+    rows = _pad(rows, len(header))
+    cols = list(zip(*rows)) if rows else [()] * len(header)
+    df = pd.DataFrame({i: pd.Series(c, dtype=object) for i, c in enumerate(cols)})
+    df.columns = header
+    return df
+
+
+def load_snapshot(sheet_id: str, ws_id: int, root: Path = SNAPSHOT_DIR):
+    """Возвращает (meta, DataFrame) или (None, None), если снимка нет."""
+    data_path, meta_path = _paths(sheet_id, ws_id, root)
+    if not (data_path.exists() and meta_path.exists()):
+        return None, None
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    df = pd.read_parquet(data_path)
+    # В Parquet колонки хранятся позиционно (c0, c1, …): заголовок листа
+    # может содержать дубли и пустые имена
+    df.columns = meta["header"]
+    return meta, df
+
+
+def save_snapshot(sheet_id: str, ws_id: int, header: list, df: pd.DataFrame,
+                  full: bool, root: Path = SNAPSHOT_DIR) -> dict:
+    data_path, meta_path = _paths(sheet_id, ws_id, root)
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+
+    out = df.copy()
+    out.columns = [f"c{i}" for i in range(len(header))]
+    tmp = data_path.with_suffix(".parquet.tmp")
+    out.to_parquet(tmp, index=False)
+    os.replace(tmp, data_path)
+
+    now = datetime.now(timezone.utc).isoformat()
+    prev = {}
+    if not full and meta_path.exists():
+        prev = json.loads(meta_path.read_text(encoding="utf-8"))
+    check = _check_column(header)
+    meta = {
+        "header": list(header),
+        "rows": len(df),
+        "first_row": _trim(df.iloc[0].tolist()) if len(df) else [],
+        "last_row": _trim(df.iloc[-1].tolist()) if len(df) else [],
+        "check_column": check,
+        "chunks": _chunk_hashes(df.iloc[:, check].astype(str).tolist()) if len(df) else [],
+        "synced_at": now,
+        "full_at": now if full else prev.get("full_at", now),
+    }
+    tmp = meta_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, meta_path)
+    return meta
+
+
+# ────────────────────────────────────────────────────────────────
+#  Синхронизация листа
+# ────────────────────────────────────────────────────────────────
+def _full_reload(ws, sheet_id: str, root: Path) -> pd.DataFrame:
+    incr("fetch.full_reload", sheet=sheet_id, ws=ws.id)
+    vals = with_backoff(ws.get_all_values)
+    if not vals:
+        return pd.DataFrame()
+    header = vals[0]
+    df = _frame(vals[1:], header)
+    save_snapshot(sheet_id, ws.id, header, df, full=True, root=root)
+    return df
+
+
+def _reload_from(ws, sheet_id: str, root: Path, meta: dict, cached: pd.DataFrame,
+                 start: int) -> pd.DataFrame:
+    """Перекачивает строки листа начиная со строки данных start (с нуля)."""
+    if start == 0:
+        return _full_reload(ws, sheet_id, root)
+    incr("fetch.partial_reload", sheet=sheet_id, ws=ws.id)
+    (rows,) = with_backoff(ws.batch_get, [f"{start + 2}:{ws.row_count}"])
+    header = meta["header"]
+    df = pd.concat([cached.iloc[:start], _frame([list(r) for r in rows], header)], ignore_index=True)
+    save_snapshot(sheet_id, ws.id, header, df, full=False, root=root)
+    return df
+
+
+def _expired(meta: dict) -> bool:
+    if FULL_RELOAD_HOURS <= 0:
+        return False
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(meta["full_at"])
+    return age > timedelta(hours=FULL_RELOAD_HOURS)
+
+
+def sync_worksheet(ws, sheet_id: str, root: Path = SNAPSHOT_DIR,
+                   force_full: bool = False) -> pd.DataFrame:
+    """
+    Приводит локальный снимок листа в соответствие с таблицей и возвращает
+    все строки листа (строковые значения, колонки = заголовок).
+
+    Инкрементальный путь — один запрос `batch_get`: строки 1–2 (заголовок и
+    первая строка данных), диапазон от последней сохранённой строки до
+    конца сетки листа и колонка затрат сохранённых строк. Второй запрос —
+    только если колонка разошлась со снимком.
+    """
+    with stage("fetch.worksheet", sheet=sheet_id, ws=ws.id):
+        return _sync_worksheet(ws, sheet_id, root, force_full)
+
+
+def _sync_worksheet(ws, sheet_id: str, root: Path, force_full: bool) -> pd.DataFrame:
+    meta, cached = (None, None) if force_full else load_snapshot(sheet_id, ws.id, root)
+    # Снимки без хэшей (старый формат) перезагружаются один раз
+    if meta is None or meta["rows"] == 0 or "chunks" not in meta or _expired(meta):
+        return _full_reload(ws, sheet_id, root)
+
+    n = meta["rows"]
+    anchor = n + 1  # номер строки листа с последней сохранённой записью
+    if anchor > ws.row_count:
+        return _full_reload(ws, sheet_id, root)
+
+    col = _column_letter(meta["check_column"])
+    head, tail, column = with_backoff(
+        ws.batch_get, ["1:2", f"{anchor}:{ws.row_count}", f"{col}2:{col}{anchor}"]
+    )
+    head = list(head) + [[]] * (2 - len(head))
+    header = _trim(head[0])
+    if header != _trim(meta["header"]) or _trim(head[1]) != meta["first_row"]:
+        return _full_reload(ws, sheet_id, root)
+
+    # Первый блок, где колонка затрат разошлась со снимком
+    values = [r[0] if r else "" for r in column] + [""] * (n - len(column))
+    stale = next(
+        (i for i, (a, b) in enumerate(zip(_chunk_hashes(values[:n]), meta["chunks"])) if a != b),
+        None,
+    )
+    if stale is not None:
+        return _reload_from(ws, sheet_id, root, meta, cached, stale * CHUNK_ROWS)
+    # Хвост сдвинулся (строки удалили или вставили) — перечитываем последний блок
+    if not tail or _trim(tail[0]) != meta["last_row"]:
+        return _reload_from(ws, sheet_id, root, meta, cached, (n - 1) // CHUNK_ROWS * CHUNK_ROWS)
+
+    new_rows = [list(r) for r in tail[1:]]
+    if not new_rows:
+        return cached
+
+    header = meta["header"]
+    fresh = _frame(new_rows, header)
+    df = pd.concat([cached, fresh], ignore_index=True)
+    save_snapshot(sheet_id, ws.id, header, df, full=False, root=root)
+    return df
+
+
+def sync_spreadsheet(sh, sheet_id: str, root: Path = SNAPSHOT_DIR,
+                     max_workers: int = MAX_WORKERS) -> list[pd.DataFrame]:
+    """
+    Синхронизирует все листы таблицы параллельно (ограниченный пул потоков)
+    и возвращает их DataFrame в порядке вкладок.
+    """
+    worksheets = with_backoff(sh.worksheets)
+    if not worksheets:
+        write_manifest(sheet_id, [], root)
+        return []
+    workers = max(1, min(max_workers, len(worksheets)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheets") as pool:
+        frames = list(pool.map(lambda ws: sync_worksheet(ws, sheet_id, root), worksheets))
+    write_manifest(sheet_id, [ws.id for ws in worksheets], root)
+    return frames
+
+
+def read_snapshots(sheet_id: str, root: Path = SNAPSHOT_DIR):
+    """
+    Листы таблицы из манифеста последней синхронизации, без обращения к
+    сети: (DataFrame, время последней синхронизации) или None, если
+    манифеста или снимка какого-то листа нет.
+    """
+    manifest = root / sheet_id / MANIFEST
+    if not manifest.exists():
+        return None
+    frames, synced = [], []
+    for ws_id in json.loads(manifest.read_text(encoding="utf-8"))["worksheets"]:
+        meta, df = load_snapshot(sheet_id, ws_id, root)
+        if meta is None:
+            return None
+        synced.append(datetime.fromisoformat(meta["synced_at"]))
+        if not df.empty:
+            frames.append(df)
+    if not synced:
+        return None
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return df, max(synced)
+
+
+# ────────────────────────────────────────────────────────────────
+#  Таблицы дашборда
+# ────────────────────────────────────────────────────────────────
+def fetch_moloco(client, sheet_id: str, root: Path = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Moloco: по вкладке на период, все вкладки склеиваются."""
+    sh = with_backoff(client.open_by_key, sheet_id)
+    frames = [f for f in sync_spreadsheet(sh, sheet_id, root) if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    if not df.empty:
+        df["traffic_source"] = "Moloco"
+    return df
+
+
+def fetch_other(client, sheet_id: str, root: Path = SNAPSHOT_DIR) -> pd.DataFrame:
+    """Другие источники: первая вкладка таблицы."""
+    sh = with_backoff(client.open_by_key, sheet_id)
+    ws = with_backoff(sh.get_worksheet, 0)
+    df = sync_worksheet(ws, sheet_id, root)
+    write_manifest(sheet_id, [ws.id], root)
+    if "traffic_source" not in df.columns:
+        df["traffic_source"] = "Other"
+    return df
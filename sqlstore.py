@@ -0,0 +1,470 @@
+"""
+Хранилище версий в файле SQLite — альтернатива DatasetStore.
+
+Нормализованные строки и дневной куб лежат в двух общих таблицах, rows и
+cube; у каждой записи есть интервал версий [first_v, last_v), в которых
+она видна. Публикация сравнивает хэши строк новой загрузки с живыми
+записями и пишет только разницу: новые строки вставляет, пропавшие
+закрывает номером новой версии. Версия v — пара представлений rows_<v> и
+cube_<v> над общими таблицами; страницы отправляют в них фильтрующие
+агрегатные запросы и получают только маленькие результаты. Память
+процесса не растёт с длиной истории, файл общий для нескольких процессов
+приложения и переживает перезапуск без повторной загрузки из Google Sheets.
+
+Записи версии не меняются, поэтому читатели работают без блокировок
+(журнал WAL). Вытесненная версия удаляется не сразу, а через
+PRUNE_GRACE_S после публикации следующей: процессы и фрагменты страниц,
+ещё читающие её, успевают перейти на новую.
+"""
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cube import KEYS, MEASURES, TIME_GRAINS, build_daily_cube
+from metrics import incr, stage
+from normalize import SCHEMA
+from rolling import derive_stats, periods
+from store import KEEP_VERSIONS
+from table_view import EXPORT_CHUNK, write_export
+
+# Срезы куба для KPI и TOP-N (см. Dataset.date_span)
+_GROUPS = {
+    None:     "1",
+    "moloco": "traffic_source = 'Moloco'",
+    "other":  "traffic_source <> 'Moloco'",
+}
+_TABLES = ("moloco", "other")
+# Номер схемы файла (PRAGMA user_version); файл другой схемы пересоздаётся
+SCHEMA_VERSION = 2
+PRUNE_GRACE_S = 15 * 60
+# Начало периода в SQL (см. cube.time_key); неделя — с понедельника
+_TIME_SQL = {
+    "date":  "event_date",
+    "week":  "date(event_date, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01', event_date)",
+}
+
+
+def _day(ts) -> str:
+    return pd.Timestamp(ts).strftime("%Y-%m-%d")
+
+
+def _records(df: pd.DataFrame, columns: list):
+    """Строки для executemany: даты — 'YYYY-MM-DD', пропуски — NULL."""
+    values = []
+    for col in columns:
+        s = df[col]
+        out = s.dt.strftime("%Y-%m-%d") if col == "event_date" else s
+        values.append(out.astype(object).where(s.notna(), None).tolist())
+    return zip(*values)
+
+
+def _frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Типы результата запроса как у нормализованных фреймов."""
+    if "event_date" in df:
+        df["event_date"] = pd.to_datetime(df["event_date"]).astype("datetime64[ns]")
+    for col in MEASURES:
+        if col in df:
+            df[col] = df[col].astype("float64")
+    return df
+
+
+def _row_hashes(df: pd.DataFrame, columns: list) -> np.ndarray:
+    """
+    Идентичность записи для публикации разницы: хэш значений и номера среди
+    одинаковых строк (дубли — разные записи). int64 — как INTEGER в SQLite.
+    """
+    h = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    occurrence = pd.Series(h).groupby(h).cumcount().to_numpy()
+    pairs = pd.DataFrame({"h": h, "n": occurrence})
+    return pd.util.hash_pandas_object(pairs, index=False).to_numpy().view(np.int64)
+
+
+def _span(dates: pd.Series) -> list:
+    return [_day(dates.min()), _day(dates.max())] if dates.notna().any() else [None, None]
+
+
+@dataclass(frozen=True)
+class SqlSelection:
+    """Отфильтрованная выборка строк таблицы: условие, порядок и число строк."""
+    where: str
+    params: tuple
+    order: str
+    count: int
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class SqlDataset:
+    """Версия в SQLite с тем же интерфейсом запросов, что у store.Dataset."""
+
+    def __init__(self, store: "SqlStore", version: int, loaded_at: datetime, info: dict):
+        self._store = store
+        self.version = version
+        self.loaded_at = loaded_at
+        self.info = info
+        self._rows = f"rows_{version}"
+        self._cube = f"cube_{version}"
+
+    def _query(self, sql: str, params=()) -> pd.DataFrame:
+        return _frame(pd.read_sql_query(sql, self._store.connection(), params=params))
+
+    def memory_usage(self) -> dict:
+        """Данные лежат на диске: размер файла базы вместе с журналом WAL, байты."""
+        files = (self._store.path, self._store.path.with_name(self._store.path.name + "-wal"))
+        size = sum(f.stat().st_size for f in files if f.exists())
+        return {"sqlite": size, "total": size}
+
+    def date_span(self, group: str = None) -> tuple:
+        start, end = self.info["span"][group or "all"]
+        return pd.Timestamp(start), pd.Timestamp(end)
+
+    def day_totals(self, group: str, days, value: str = "cost_rub") -> pd.DataFrame:
+        assert value in MEASURES
+        days = pd.DatetimeIndex(days)
+        marks = ", ".join("?" * len(days))
+        df = self._query(
+            f"SELECT traffic_source, event_date, SUM({value}) AS value FROM {self._cube} "
+            f"WHERE event_date IN ({marks}) AND {_GROUPS[group]} GROUP BY 1, 2",
+            [_day(d) for d in days],
+        )
+        out = df.pivot(index="traffic_source", columns="event_date", values="value")
+        return out.reindex(index=self.info["sources"][group], columns=days).fillna(0.0)
+
+    def daily(self, value: str = "cost_rub") -> pd.DataFrame:
+        assert value in MEASURES
+        df = self._query(
+            f"SELECT event_date, traffic_source, SUM({value}) AS {value} FROM {self._cube} "
+            f"GROUP BY 1, 2 ORDER BY 1, 2"
+        )
+        df[value] = df[value].fillna(0.0)
+        return df
+
+    def top(self, group: str, start, end, n: int = 10):
+        """TOP-N bayer_id за [start, end]; результат как у BayerRangeIndex.top."""
+        value = "cost_rub"
+        where = f"event_date BETWEEN ? AND ? AND {_GROUPS[group]}"
+        span = [_day(start), _day(end)]
+        totals = self._query(
+            f"SELECT bayer_id, SUM({value}) AS {value} FROM {self._cube} WHERE {where} "
+            f"GROUP BY bayer_id HAVING SUM({value}) <> 0 ORDER BY 2 DESC, 1 LIMIT ?",
+            [*span, n],
+        ).iloc[::-1].reset_index(drop=True)
+
+        ids = totals["bayer_id"].tolist()
+        marks = ", ".join("?" * len(ids)) or "NULL"
+        breakdown = self._query(
+            f"SELECT bayer_id, traffic_source, SUM({value}) AS {value} FROM {self._cube} "
+            f"WHERE {where} AND bayer_id IN ({marks}) "
+            f"GROUP BY 1, 2 HAVING SUM({value}) <> 0",
+            [*span, *ids],
+        )
+        rank = {b: i for i, b in enumerate(ids)}
+        breakdown = (
+            breakdown.assign(_rank=breakdown["bayer_id"].map(rank))
+            .sort_values(["_rank", "traffic_source"], kind="stable")
+            .drop(columns="_rank")
+            .reset_index(drop=True)
+        )
+        return totals, breakdown
+
+    def period_stats(self, key: str, day) -> pd.DataFrame:
+        """Сравнения периодов (см. rolling.py): все суммы — один проход условной агрегацией."""
+        assert key in ("traffic_source", "bayer_id")
+        spans = periods(day)
+        sums = [f"TOTAL(CASE WHEN event_date BETWEEN ? AND ? THEN cost_rub END) AS {name}" for name in spans]
+        params = [_day(d) for span in spans.values() for d in span]
+        lo = min(a for a, _ in spans.values())
+        df = self._query(
+            f"SELECT {key}, {', '.join(sums)} FROM {self._cube} "
+            f"WHERE event_date BETWEEN ? AND ? GROUP BY 1 ORDER BY 1",
+            [*params, _day(lo), _day(day)],
+        )
+        return derive_stats(df.set_index(key))
+
+    def rollup(self, dims, value: str = "cost_rub", start=None, end=None) -> pd.DataFrame:
+        """Суммы по измерениям dims — GROUP BY в базе, как cube.rollup."""
+        assert value in MEASURES
+        exprs = [f"{_TIME_SQL[d] if d in TIME_GRAINS else d} AS {d}" for d in dims]
+        where, params = ["1"], []
+        if start is not None:
+            where.append("event_date >= ?")
+            params.append(_day(start))
+        if end is not None:
+            where.append("event_date <= ?")
+            params.append(_day(end))
+        df = self._query(
+            f"SELECT {', '.join(exprs)}, SUM({value}) AS {value} FROM {self._cube} "
+            f"WHERE {' AND '.join(where)} GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))}",
+            params,
+        )
+        for d in dims:
+            if d in TIME_GRAINS:
+                df[d] = pd.to_datetime(df[d]).astype("datetime64[ns]")
+        df[value] = df[value].fillna(0.0)
+        return df
+
+    def table_info(self, name: str) -> dict:
+        t = self.info["tables"][name]
+        return {
+            "rows":    t["rows"],
+            "start":   pd.Timestamp(t["span"][0]),
+            "end":     pd.Timestamp(t["span"][1]),
+            "sources": t["sources"],
+            "columns": list(SCHEMA),
+        }
+
+    def select(self, name: str, start=None, end=None, sources=(), bayer: str = "",
+               sort_by: str = None, ascending: bool = True) -> SqlSelection:
+        """Условие и порядок выборки; строки читаются постранично в page/export."""
+        assert name in _TABLES
+        where, params = ["sheet = ?"], [name]
+        if start is not None:
+            where.append("event_date >= ?")
+            params.append(_day(start))
+        if end is not None:
+            where.append("event_date <= ?")
+            params.append(_day(end))
+        if sources:
+            where.append(f"traffic_source IN ({', '.join('?' * len(sources))})")
+            params.extend(sources)
+        if bayer:
+            where.append("instr(lower(bayer_id), lower(?)) > 0")
+            params.append(bayer)
+        where = " AND ".join(where)
+
+        # Без сортировки — в порядке поступления строк
+        order = "id"
+        if sort_by:
+            assert sort_by in SCHEMA
+            # Пустые значения — в конце, равные — в порядке поступления
+            order = f"{sort_by} IS NULL, {sort_by} {'ASC' if ascending else 'DESC'}, id"
+        (count,), = self._store.connection().execute(
+            f"SELECT COUNT(*) FROM {self._rows} WHERE {where}", params
+        ).fetchall()
+        return SqlSelection(where, tuple(params), order, count)
+
+    def _select_sql(self, sel: SqlSelection) -> str:
+        return f"SELECT {', '.join(SCHEMA)} FROM {self._rows} WHERE {sel.where} ORDER BY {sel.order}"
+
+    def page(self, name: str, sel: SqlSelection, page: int, size: int) -> pd.DataFrame:
+        return self._query(f"{self._select_sql(sel)} LIMIT ? OFFSET ?", [*sel.params, size, page * size])
+
+    def export(self, name: str, sel: SqlSelection, fmt: str, chunk: int = EXPORT_CHUNK):
+        """Выгрузка выборки частями по chunk строк (см. table_view.write_export)."""
+        def parts():
+            # Отдельное соединение: курсор живёт, пока пишется файл
+            with sqlite3.connect(self._store.path) as conn:
+                cur = conn.execute(self._select_sql(sel), sel.params)
+                while rows := cur.fetchmany(chunk):
+                    yield _frame(pd.DataFrame(rows, columns=SCHEMA))
+
+        empty = _frame(pd.DataFrame({c: pd.Series(dtype=object) for c in SCHEMA}))
+        empty[["traffic_source", "bayer_id"]] = empty[["traffic_source", "bayer_id"]].astype(str)
+        return write_export(parts(), empty, fmt)
+
+
+class SqlStore:
+    """
+    Реестр версий в файле SQLite с интерфейсом DatasetStore: publish,
+    current, get. Номера версий общие для всех процессов, открывших файл.
+    """
+
+    def __init__(self, path, keep: int = KEEP_VERSIONS, grace_s: float = PRUNE_GRACE_S):
+        self.path = Path(path)
+        self._keep = keep
+        self._grace = grace_s
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._datasets: dict[int, SqlDataset] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            (schema,), = conn.execute("PRAGMA user_version").fetchall()
+            if schema != SCHEMA_VERSION:
+                self._create_schema(conn)
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _create_schema(conn: sqlite3.Connection):
+        """Схема с нуля; таблицы прежнего формата — кэш, данные придут из Sheets."""
+        for kind, name in conn.execute(
+            "SELECT type, name FROM sqlite_master WHERE type IN ('table', 'view') "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY type = 'table'"
+        ).fetchall():
+            conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+        conn.execute(
+            "CREATE TABLE versions (version INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "loaded_at TEXT NOT NULL, info TEXT NOT NULL, published_at REAL NOT NULL)"
+        )
+        versioned = "hash INTEGER NOT NULL, first_v INTEGER NOT NULL, last_v INTEGER"
+        conn.execute(
+            "CREATE TABLE rows (id INTEGER PRIMARY KEY, sheet TEXT, event_date TEXT, "
+            f"traffic_source TEXT, bayer_id TEXT, cost_usd REAL, cost_rub REAL, {versioned})"
+        )
+        conn.execute(
+            "CREATE TABLE cube (id INTEGER PRIMARY KEY, event_date TEXT, traffic_source TEXT, "
+            f"bayer_id TEXT, cost_usd REAL, cost_rub REAL, {versioned})"
+        )
+        conn.execute("CREATE INDEX rows_keys ON rows (event_date, traffic_source, bayer_id)")
+        conn.execute("CREATE INDEX rows_sheet ON rows (sheet, event_date)")
+        conn.execute("CREATE INDEX cube_keys ON cube (event_date, traffic_source, bayer_id)")
+        # Живые записи (last_v IS NULL) и их хэши — для сравнения при публикации
+        conn.execute("CREATE INDEX rows_live ON rows (last_v, hash)")
+        conn.execute("CREATE INDEX cube_live ON cube (last_v, hash)")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (sqlite3 не делит соединения между потоками)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @staticmethod
+    def _apply_delta(conn: sqlite3.Connection, table: str, version: int, columns: list,
+                     parts: list) -> None:
+        """
+        Приводит живые записи table к parts — списку (префикс, фрейм): новые
+        строки вставляет с first_v = version, пропавшие закрывает last_v = version.
+        """
+        hashes = [_row_hashes(df.assign(**prefix), list(prefix) + columns) for prefix, df in parts]
+        live = np.array(conn.execute(f"SELECT id, hash FROM {table} WHERE last_v IS NULL").fetchall(),
+                        dtype=np.int64).reshape(-1, 2)
+        fresh = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.int64)
+        # isin по хэш-таблице pandas: np.isin сортирует оба массива
+        known = pd.Index(live[:, 1])
+        gone = live[~known.isin(fresh), 0]
+        conn.executemany(f"UPDATE {table} SET last_v = ? WHERE id = ?", ((version, i) for i in gone.tolist()))
+
+        inserted = 0
+        for (prefix, df), h in zip(parts, hashes):
+            new = ~pd.Index(h).isin(known)
+            if not new.any():
+                continue
+            names = list(prefix) + columns + ["hash", "first_v"]
+            marks = ", ".join("?" * len(names))
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(names)}) VALUES ({marks})",
+                ((*prefix.values(), *r, hv, version)
+                 for r, hv in zip(_records(df[new], columns), h[new].tolist())),
+            )
+            inserted += int(new.sum())
+        incr("sql.publish.inserted", inserted, table=table)
+        incr("sql.publish.retired", len(gone), table=table)
+
+    def publish(self, moloco: pd.DataFrame, other: pd.DataFrame,
+                loaded_at: datetime) -> SqlDataset:
+        with stage("aggregate"):
+            cube = build_daily_cube(moloco, other)
+        is_moloco = cube["traffic_source"] == "Moloco"
+        info = {
+            "span": {
+                "all":    _span(cube["event_date"]),
+                "moloco": _span(cube.loc[is_moloco, "event_date"]),
+                "other":  _span(cube.loc[~is_moloco, "event_date"]),
+            },
+            "sources": {
+                "moloco": sorted(cube.loc[is_moloco, "traffic_source"].astype(str).unique()),
+                "other":  sorted(cube.loc[~is_moloco, "traffic_source"].astype(str).unique()),
+            },
+            "tables": {
+                name: {
+                    "rows": len(df),
+                    "span": _span(df["event_date"]),
+                    "sources": sorted(df["traffic_source"].dropna().astype(str).unique()),
+                }
+                for name, df in zip(_TABLES, (moloco, other))
+            },
+        }
+
+        conn = self._connect()
+        try:
+            with stage("sql.publish"):
+                # Одна транзакция: читатели видят версию только целиком,
+                # а разница считается от живых записей без гонок с другими процессами
+                conn.execute("BEGIN IMMEDIATE")
+                version = conn.execute(
+                    "INSERT INTO versions (loaded_at, info, published_at) VALUES (?, ?, ?)",
+                    (loaded_at.isoformat(), json.dumps(info, ensure_ascii=False), time.time()),
+                ).lastrowid
+                self._apply_delta(conn, "rows", version, SCHEMA,
+                                  [({"sheet": name}, df) for name, df in zip(_TABLES, (moloco, other))])
+                self._apply_delta(conn, "cube", version, KEYS + MEASURES, [({}, cube)])
+                visible = f"first_v <= {version} AND (last_v IS NULL OR last_v > {version})"
+                conn.execute(f"CREATE VIEW rows_{version} AS SELECT id, sheet, {', '.join(SCHEMA)} "
+                             f"FROM rows WHERE {visible}")
+                conn.execute(f"CREATE VIEW cube_{version} AS SELECT {', '.join(KEYS + MEASURES)} "
+                             f"FROM cube WHERE {visible}")
+                conn.execute("COMMIT")
+            self._prune(conn)
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get(version)
+
+    def _prune(self, conn: sqlite3.Connection):
+        """
+        Удаляет версии старше последних keep, вытесненные дольше grace_s
+        назад, и записи, которые не видны ни в одной оставшейся версии.
+        """
+        versions = conn.execute("SELECT version, published_at FROM versions ORDER BY version").fetchall()
+        now = time.time()
+        old = [
+            v for (v, _), (_, superseded_at) in zip(versions[:-self._keep], versions[1:])
+            if now - superseded_at >= self._grace
+        ]
+        if not old:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        for version in old:
+            conn.execute(f"DROP VIEW IF EXISTS rows_{version}")
+            conn.execute(f"DROP VIEW IF EXISTS cube_{version}")
+            conn.execute("DELETE FROM versions WHERE version = ?", (version,))
+        for table in ("rows", "cube"):
+            conn.execute(f"DELETE FROM {table} WHERE last_v <= (SELECT MIN(version) FROM versions)")
+        conn.execute("COMMIT")
+        with self._lock:
+            for version in old:
+                self._datasets.pop(version, None)
+
+    def current(self):
+        (version,), = self.connection().execute("SELECT MAX(version) FROM versions").fetchall()
+        return self.get(version) if version is not None else None
+
+    def get(self, version):
+        """
+        Версия по номеру; если её уже удалил этот или другой процесс — текущая.
+        Наличие версии проверяется в базе на каждом вызове.
+        """
+        row = self.connection().execute(
+            "SELECT loaded_at, info FROM versions WHERE version = ?", (version,)
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self._datasets.pop(version, None)
+            return self.current()
+        with self._lock:
+            if (ds := self._datasets.get(version)) is not None:
+                return ds
+        ds = SqlDataset(self, version, datetime.fromisoformat(row[0]), json.loads(row[1]))
+        with self._lock:
+            self._datasets[version] = ds
+            while len(self._datasets) > self._keep + 2:
+                del self._datasets[min(self._datasets)]
+        return ds
@@ -0,0 +1,193 @@
+"""
+Общее для всего процесса хранилище загруженных данных.
+
+Каждая загрузка публикует неизменяемую версию набора данных (Dataset):
+компактные нормализованные фреймы, дневной куб и индексы TOP-N. Сессии
+хранят только номер версии и читают общие фреймы без копирования, поэтому
+память не растёт с числом открытых вкладок дашборда.
+
+Страницы обращаются к версии только через методы запросов (day_totals,
+daily, top, period_stats, rollup, select, page, export). Тот же интерфейс у sqlstore.SqlDataset,
+который держит данные в файле SQLite вместо памяти процесса.
+"""
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from cube import BayerRangeIndex, build_daily_cube, daily_by_source, rollup, source_day_totals
+from metrics import stage
+from rolling import RollingStats
+from table_view import export_file, page_slice, select_rows, sort_rows
+
+KEEP_VERSIONS = 2
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Компактные типы для сырых строк: текст → category, затраты → float32,
+    если точности float32 хватает до копеек. Агрегаты (куб) остаются float64.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+            s = s.astype("category")
+        elif s.dtype == "float64":
+            s32 = s.astype("float32")
+            diff = np.abs(s32.to_numpy(dtype="float64") - s.to_numpy())
+            if np.all(np.isnan(diff) | (diff < 0.005)):
+                s = s32
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def _nbytes(obj) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, (BayerRangeIndex, RollingStats)):
+        return obj.nbytes
+    return 0
+
+
+@dataclass(frozen=True)
+class Dataset:
+    version: int
+    loaded_at: datetime
+    moloco: pd.DataFrame
+    other: pd.DataFrame
+    cube: pd.DataFrame
+    bayer_index: dict = field(default_factory=dict)
+    rolling: dict = field(default_factory=dict)
+
+    def memory_usage(self) -> dict:
+        """Память по компонентам версии, байты."""
+        usage = {
+            "moloco": _nbytes(self.moloco),
+            "other":  _nbytes(self.other),
+            "cube":   _nbytes(self.cube),
+        }
+        for name, ix in self.bayer_index.items():
+            usage[f"index.{name}"] = _nbytes(ix)
+        for key, rs in self.rolling.items():
+            usage[f"rolling.{key}"] = _nbytes(rs)
+        usage["total"] = sum(usage.values())
+        return usage
+
+    # ── запросы страниц ──────────────────────────────────────────
+    # group — срез куба: "moloco" (traffic_source == Moloco) или "other";
+    # name — исходная таблица: "moloco" или "other".
+
+    @cached_property
+    def _groups(self) -> dict:
+        is_moloco = self.cube["traffic_source"] == "Moloco"
+        return {None: self.cube, "moloco": self.cube[is_moloco], "other": self.cube[~is_moloco]}
+
+    def date_span(self, group: str = None) -> tuple:
+        """Первый и последний день куба (или его среза)."""
+        dates = self._groups[group]["event_date"]
+        return dates.min(), dates.max()
+
+    def day_totals(self, group: str, days, value: str = "cost_rub") -> pd.DataFrame:
+        return source_day_totals(self._groups[group], days, value)
+
+    def daily(self, value: str = "cost_rub") -> pd.DataFrame:
+        return daily_by_source(self.cube, value)
+
+    def top(self, group: str, start, end, n: int = 10):
+        return self.bayer_index[group].top(start, end, n=n)
+
+    def period_stats(self, key: str, day) -> pd.DataFrame:
+        """Сравнения периодов на день day по traffic_source или bayer_id (см. rolling.py)."""
+        return self.rolling[key].stats(day)
+
+    def rollup(self, dims, value: str = "cost_rub", start=None, end=None) -> pd.DataFrame:
+        return rollup(self.cube, dims, value, start, end)
+
+    def table_info(self, name: str) -> dict:
+        """Число строк, границы дат, источники и колонки таблицы."""
+        df = getattr(self, name)
+        return {
+            "rows":    len(df),
+            "start":   df["event_date"].min(),
+            "end":     df["event_date"].max(),
+            "sources": df["traffic_source"].cat.categories.tolist(),
+            "columns": df.columns.tolist(),
+        }
+
+    def select(self, name: str, start=None, end=None, sources=(), bayer: str = "",
+               sort_by: str = None, ascending: bool = True) -> np.ndarray:
+        """Номера строк после фильтров и сортировки; сами строки не копируются."""
+        df = getattr(self, name)
+        rows = select_rows(
+            df, start, end,
+            filters={"traffic_source": list(sources)},
+            search={"bayer_id": bayer},
+        )
+        return sort_rows(df, rows, sort_by, ascending)
+
+    def page(self, name: str, rows: np.ndarray, page: int, size: int) -> pd.DataFrame:
+        return page_slice(getattr(self, name), rows, page, size)
+
+    def export(self, name: str, rows: np.ndarray, fmt: str):
+        return export_file(getattr(self, name), rows, fmt)
+
+
+def build_dataset(version: int, loaded_at: datetime,
+                  moloco: pd.DataFrame, other: pd.DataFrame) -> Dataset:
+    """
+    Собирает версию из нормализованных фреймов (см. normalize.py) с уже
+    заполненными cost_usd и cost_rub (см. fx.apply_fx).
+    """
+    cube = build_daily_cube(moloco, other)
+    is_moloco = cube["traffic_source"] == "Moloco"
+    bayer_index = {
+        "moloco": BayerRangeIndex(cube[is_moloco], "cost_rub"),
+        "other":  BayerRangeIndex(cube[~is_moloco], "cost_rub"),
+    }
+    rolling = {key: RollingStats(cube, key) for key in ("traffic_source", "bayer_id")}
+    return Dataset(
+        version=version,
+        loaded_at=loaded_at,
+        moloco=compact(moloco),
+        other=compact(other),
+        cube=cube,
+        bayer_index=bayer_index,
+        rolling=rolling,
+    )
+
+
+class DatasetStore:
+    """Потокобезопасный реестр версий; хранит последние KEEP_VERSIONS."""
+
+    def __init__(self, keep: int = KEEP_VERSIONS):
+        self._keep = keep
+        self._lock = threading.Lock()
+        self._versions: dict[int, Dataset] = {}
+        self._next = 1
+
+    def publish(self, moloco: pd.DataFrame, other: pd.DataFrame,
+                loaded_at: datetime) -> Dataset:
+        with self._lock:
+            version = self._next
+            self._next += 1
+        with stage("aggregate", version=version):
+            ds = build_dataset(version, loaded_at, moloco, other)
+        with self._lock:
+            self._versions[version] = ds
+            while len(self._versions) > self._keep:
+                del self._versions[min(self._versions)]
+        return ds
+
+    def current(self):
+        with self._lock:
+            return self._versions[max(self._versions)] if self._versions else None
+
+    def get(self, version):
+        """Версия по номеру; если она уже вытеснена — текущая."""
+        with self._lock:
+            ds = self._versions.get(version)
+        return ds or self.current()
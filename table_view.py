@@ -0,0 +1,117 @@
+"""
+Постраничный просмотр таблиц на сервере.
+
+Фильтры, сортировка и нарезка страниц выполняются над номерами строк
+(NumPy), а в браузер сериализуется только видимая страница. Выгрузка всего
+отфильтрованного результата пишется в файл частями, без сборки целого
+CSV/Parquet в памяти.
+"""
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXPORT_CHUNK = 100_000
+
+
+def select_rows(df: pd.DataFrame, start=None, end=None,
+                filters: dict = None, search: dict = None) -> np.ndarray:
+    """
+    Номера строк, прошедших фильтры:
+      start / end — границы event_date включительно;
+      filters     — колонка → список допустимых значений;
+      search      — колонка → подстрока (без учёта регистра).
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None or end is not None:
+        dates = df["event_date"].to_numpy()
+        if start is not None:
+            mask &= dates >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            mask &= dates <= np.datetime64(pd.Timestamp(end))
+    for col, values in (filters or {}).items():
+        if values:
+            mask &= df[col].isin(values).to_numpy()
+    for col, text in (search or {}).items():
+        if not text:
+            continue
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # Поиск по словарю категорий, затем раскладка по кодам строк
+            hit = s.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+            codes = s.cat.codes.to_numpy()
+            mask &= np.where(codes >= 0, np.append(hit, False)[codes], False)
+        else:
+            mask &= s.astype(str).str.contains(text, case=False, regex=False).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def sort_rows(df: pd.DataFrame, rows: np.ndarray, by: str = None,
+              ascending: bool = True) -> np.ndarray:
+    """Упорядочивает номера строк по колонке; пустые значения — в конце."""
+    if not by or len(rows) == 0:
+        return rows
+    s = df[by]
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Ранг категорий по значению: порядок словаря не обязан быть отсортированным
+        rank = np.argsort(np.argsort(s.cat.categories.astype(str), kind="stable"))
+        codes = s.cat.codes.to_numpy()[rows]
+        key = np.where(codes >= 0, rank[codes], len(rank)).astype("float64")
+        missing = codes < 0
+    else:
+        values = s.to_numpy()[rows]
+        if values.dtype.kind == "M":
+            values = values.astype("int64").astype("float64")
+            missing = s.isna().to_numpy()[rows]
+        else:
+            values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype="float64")
+            missing = np.isnan(values)
+        key = values
+    if not ascending:
+        key = -key
+    key = np.where(missing, np.inf, key)
+    return rows[np.argsort(key, kind="stable")]
+
+
+def page_slice(df: pd.DataFrame, rows: np.ndarray, page: int, size: int) -> pd.DataFrame:
+    """Страница page (с нуля) размера size — единственная копия данных."""
+    return df.iloc[rows[page * size:(page + 1) * size]]
+
+
+def _chunks(df: pd.DataFrame, rows: np.ndarray, chunk: int):
+    for i in range(0, len(rows), chunk):
+        yield df.iloc[rows[i:i + chunk]]
+
+
+def write_export(parts, empty: pd.DataFrame, fmt: str) -> bytes:
+    """
+    Пишет фреймы parts во временный файл на диске и возвращает его содержимое.
+    empty — пустой фрейм с колонками и типами частей. Файл, а не буфер в
+    памяти: части не копятся при записи; download_button всё равно ждёт
+    bytes (объект временного файла он не принимает), и файл сразу закрывается.
+    """
+    with tempfile.TemporaryFile() as f:
+        if fmt == "csv":
+            f.write("\ufeff".encode())  # BOM: Excel открывает кириллицу без вопросов
+            header = True
+            for part in parts:
+                f.write(part.to_csv(index=False, header=header).encode("utf-8"))
+                header = False
+            if header:
+                f.write(empty.to_csv(index=False).encode("utf-8"))
+        elif fmt == "parquet":
+            schema = pa.Schema.from_pandas(empty, preserve_index=False)
+            with pq.ParquetWriter(f, schema) as writer:
+                for part in parts:
+                    writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+        else:
+            raise ValueError(f"unknown export format: {fmt}")
+        f.seek(0)
+        return f.read()
+
+
+def export_file(df: pd.DataFrame, rows: np.ndarray, fmt: str, chunk: int = EXPORT_CHUNK):
+    """Выгрузка выбранных строк частями по chunk строк (см. write_export)."""
+    return write_export(_chunks(df, rows, chunk), df.iloc[:0], fmt)
@@ -0,0 +1,87 @@
+"""TOP-N bayer_id по диапазону дат: BayerRangeIndex против groupby по кубу."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import BayerRangeIndex
+
+
+@pytest.fixture(scope="module")
+def cube():
+    rng = np.random.default_rng(5)
+    n = 4000
+    cube = pd.DataFrame({
+        "event_date":     pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 200, n), unit="D"),
+        "traffic_source": pd.Categorical(rng.choice(["TikTok", "Google Ads", "Telegram Ads"], n)),
+        "bayer_id":       pd.Categorical(rng.integers(0, 150, n).astype(str)),
+        "cost_usd":       rng.random(n) * 100,
+        "cost_rub":       np.where(rng.random(n) < 0.05, np.nan, rng.random(n) * 9000),
+    })
+    # bayer_id с затратами только в последнюю неделю
+    late = cube.iloc[:5].assign(event_date=pd.Timestamp("2024-07-15"), bayer_id="late")
+    return pd.concat([cube, late], ignore_index=True).astype({"bayer_id": "category"})
+
+
+@pytest.fixture(scope="module")
+def index(cube):
+    return BayerRangeIndex(cube, "cost_rub")
+
+
+def _period(cube, start, end):
+    return cube[cube["event_date"].between(pd.Timestamp(start), pd.Timestamp(end))]
+
+
+def _brute_top(cube, start, end, n):
+    period = _period(cube, start, end)
+    sums = period.groupby(period["bayer_id"].astype(str))["cost_rub"].sum()
+    return sums[sums != 0].nlargest(n).sort_values()
+
+
+RANGES = [
+    ("2024-01-01", "2024-07-18"),     # весь куб
+    ("2024-02-10", "2024-03-05"),
+    ("2024-04-01", "2024-04-01"),     # один день
+    ("2023-06-01", "2024-01-03"),     # начинается раньше данных
+    ("2024-07-10", "2025-01-01"),     # кончается позже
+]
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+@pytest.mark.parametrize("n", [1, 10, 500])
+def test_top_matches_groupby(cube, index, start, end, n):
+    top, _ = index.top(start, end, n=n)
+    want = _brute_top(cube, start, end, n)
+    assert top["bayer_id"].tolist() == want.index.tolist()
+    np.testing.assert_allclose(top["cost_rub"], want.to_numpy(), rtol=1e-9)
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_breakdown_matches_groupby(cube, index, start, end):
+    top, breakdown = index.top(start, end, n=10)
+    period = _period(cube, start, end)
+    period = period[period["bayer_id"].astype(str).isin(top["bayer_id"])]
+    want = period.groupby([period["bayer_id"].astype(str), period["traffic_source"].astype(str)])["cost_rub"].sum()
+    want = want[want != 0]
+    # Порядок: bayer_id как в totals, внутри — источники по алфавиту
+    rank = {b: i for i, b in enumerate(top["bayer_id"])}
+    want = want.iloc[sorted(range(len(want)), key=lambda i: (rank[want.index[i][0]], want.index[i][1]))]
+
+    assert list(zip(breakdown["bayer_id"], breakdown["traffic_source"])) == want.index.tolist()
+    np.testing.assert_allclose(breakdown["cost_rub"], want.to_numpy(), rtol=1e-9)
+    # Разбивка складывается в итоги
+    np.testing.assert_allclose(breakdown.groupby("bayer_id")["cost_rub"].sum()[top["bayer_id"]], top["cost_rub"])
+
+
+def test_totals_for_every_bayer(cube, index):
+    period = _period(cube, "2024-03-01", "2024-05-31")
+    want = period.groupby(period["bayer_id"].astype(str))["cost_rub"].sum()
+    got = pd.Series(index.totals("2024-03-01", "2024-05-31"), index=index.bayers)
+    np.testing.assert_allclose(got[want.index], want.to_numpy(), rtol=1e-9)
+    assert got["late"] == 0
+
+
+@pytest.mark.parametrize("start, end", [("2022-01-01", "2022-12-31"), ("2024-05-01", "2024-04-01")])
+def test_empty_period(index, start, end):
+    top, breakdown = index.top(start, end)
+    assert top.empty and breakdown.empty
+    assert top.columns.tolist() == ["bayer_id", "cost_rub"]
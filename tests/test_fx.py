@@ -0,0 +1,96 @@
+"""Курсы ЦБ по дням с подменённым провайдером: сеть не нужна."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from fx import FxTable, apply_fx
+
+
+class Provider:
+    """Курсы по рабочим дням: USD = 90 + номер дня от 2024-01-01, EUR = USD + 10."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((pd.Timestamp(start), pd.Timestamp(end)))
+        days = pd.bdate_range(start, end)
+        usd = 90.0 + (days - pd.Timestamp("2024-01-01")).days
+        return pd.DataFrame({"USD": usd, "EUR": usd + 10}, index=days)
+
+
+@pytest.fixture
+def provider():
+    return Provider()
+
+
+@pytest.fixture
+def table(tmp_path, provider):
+    return FxTable(tmp_path / "fx.parquet", provider=provider)
+
+
+def _fetched_days(provider) -> list:
+    return [d for a, b in provider.calls for d in pd.date_range(a, b)]
+
+
+def test_weekend_uses_friday_rate(table):
+    table.ensure("2024-01-08", "2024-01-15")
+    rates = table.rates(pd.to_datetime(["2024-01-12", "2024-01-13", "2024-01-14", "2024-01-15"]))
+    assert rates["USD"].tolist() == [101.0, 101.0, 101.0, 104.0]
+
+
+def test_first_day_gets_previous_business_day(table):
+    # Суббота в начале диапазона: нужен курс пятницы до него
+    table.ensure("2024-01-13", "2024-01-20")
+    assert table.rates(pd.to_datetime(["2024-01-13"]))["USD"].tolist() == [101.0]
+
+
+def test_known_dates_are_not_refetched(table, provider):
+    table.ensure("2024-01-08", "2024-01-19")
+    table.ensure("2024-01-10", "2024-01-17")
+    assert len(provider.calls) == 1
+    provider.calls.clear()
+    table.ensure("2024-01-08", "2024-01-31")
+    assert min(_fetched_days(provider)) == pd.Timestamp("2024-01-20")
+
+
+def test_gaps_on_both_sides_are_backfilled(table, provider):
+    table.ensure("2024-02-01", "2024-02-09")
+    provider.calls.clear()
+    table.ensure("2024-01-10", "2024-02-20")
+    fetched = pd.DatetimeIndex(_fetched_days(provider))
+    assert not fetched.isin(pd.date_range("2024-02-01", "2024-02-09")).any()
+    rates = table.rates(pd.to_datetime(["2024-01-10", "2024-02-20"]))
+    assert rates["USD"].tolist() == [99.0, 140.0]
+
+
+def test_table_survives_restart(tmp_path, provider):
+    FxTable(tmp_path / "fx.parquet", provider=provider).ensure("2024-01-08", "2024-01-19")
+    again = FxTable(tmp_path / "fx.parquet", provider=provider)
+    again.ensure("2024-01-08", "2024-01-19")
+    assert len(provider.calls) == 1
+    assert again.latest() == (108.0, 118.0)
+
+
+def test_provider_failure_keeps_known_rates(table):
+    table.ensure("2024-01-08", "2024-01-12")
+
+    def offline(start, end):
+        raise ConnectionError("no network")
+
+    table._provider = offline
+    table.ensure("2024-01-08", "2024-01-31")
+    assert table.latest() == (101.0, 111.0)
+
+
+def test_apply_fx_converts_by_day(table):
+    table.ensure("2024-01-08", "2024-01-15")
+    df = pd.DataFrame({
+        "event_date": pd.to_datetime(["2024-01-08", "2024-01-13", "2024-01-15", None]),
+        "cost_usd": [1.0, 2.0, np.nan, 1.0],
+        "cost_rub": [np.nan, np.nan, 208.0, np.nan],
+    })
+    out = apply_fx(df, table)
+    assert out["cost_rub"].tolist()[:3] == [97.0, 202.0, 208.0]
+    assert out["cost_usd"].tolist()[2] == 2.0
+    assert np.isnan(out["cost_rub"].iloc[3])
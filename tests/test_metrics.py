@@ -0,0 +1,39 @@
+"""Память процесса для метрик на платформах без /proc."""
+import builtins
+import math
+import sys
+import types
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def no_proc(monkeypatch):
+    real_open = builtins.open
+
+    def fake_open(path, *args, **kwargs):
+        if str(path).startswith("/proc/"):
+            raise FileNotFoundError(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", fake_open)
+
+
+def _resource(maxrss: int):
+    usage = types.SimpleNamespace(ru_maxrss=maxrss)
+    return types.SimpleNamespace(RUSAGE_SELF=0, getrusage=lambda who: usage)
+
+
+def test_windows_without_resource(no_proc, monkeypatch):
+    monkeypatch.setitem(sys.modules, "resource", None)     # import resource → ImportError
+    assert math.isnan(metrics._rss_mb())
+    assert "dashboard_rss_mb nan" in metrics.Metrics(path="").to_prometheus()
+
+
+@pytest.mark.parametrize("platform, maxrss", [("linux", 300 * 1024), ("darwin", 300 * 2**20)])
+def test_maxrss_units(no_proc, monkeypatch, platform, maxrss):
+    monkeypatch.setitem(sys.modules, "resource", _resource(maxrss))
+    monkeypatch.setattr(sys, "platform", platform)
+    assert metrics._rss_mb() == 300
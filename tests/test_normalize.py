@@ -0,0 +1,80 @@
+"""Типизация сырых строк листов: суммы и даты против прежнего разбора построчно."""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from normalize import normalize_moloco, normalize_other, parse_dates, parse_money
+
+
+def clean_num(s: str) -> float:
+    """Прежний построчный разбор из app.py; пустое и нечисловое — NaN."""
+    try:
+        return float(re.sub(r"\s+", "", s).replace(",", "."))
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _frame(tab: list) -> pd.DataFrame:
+    return pd.DataFrame(tab[1:], columns=tab[0])
+
+
+@pytest.mark.parametrize("value", [
+    "183\u00a0828,88",         # неразрывный пробел — разделитель разрядов в русской локали
+    "1\u202f234\u202f567,5",   # узкий неразрывный пробел
+    "12\u20099,99",            # тонкая шпация
+    "1 234,56",
+    " 42 ",
+    "0,5",
+    "-17,25",
+    "1234.5",
+    "",
+    "   ",
+    "n/a",
+])
+def test_parse_money_matches_clean_num(value):
+    got = parse_money(pd.Series([value])).iloc[0]
+    np.testing.assert_equal(got, clean_num(value))
+
+
+def test_parse_money_keeps_missing_cells():
+    got = parse_money(pd.Series(["1,5", None, np.nan], dtype=object))
+    assert got.dtype == "float64"
+    np.testing.assert_equal(got.to_numpy(), [1.5, np.nan, np.nan])
+
+
+@pytest.mark.parametrize("dtype", [object, "str"])
+def test_synthetic_spend_is_not_lost(dtype):
+    tabs = synthetic.sheets(5000)
+    moloco = pd.concat([_frame(t) for t in tabs["moloco"]], ignore_index=True).astype(dtype)
+    other = _frame(tabs["other"][0]).astype(dtype)
+
+    usd = normalize_moloco(moloco)["cost_usd"]
+    rub = normalize_other(other)["cost_rub"]
+    assert usd.notna().all() and rub.notna().all()
+    assert usd.sum() == pytest.approx(sum(clean_num(v) for v in moloco["cost"]))
+    assert rub.sum() == pytest.approx(sum(clean_num(v) for v in other["costs"]))
+
+
+def test_parse_dates_mixed_formats():
+    got = parse_dates(pd.Series(["2024-03-01 10:15:00", "2024-03-01", "01.03.2024", ""]))
+    assert got.dtype == "datetime64[ns]"
+    assert got.iloc[:2].tolist() == [pd.Timestamp("2024-03-01")] * 2
+    assert got.isna().iloc[3]
+
+
+def test_normalize_schema_and_aliases():
+    raw = pd.DataFrame({
+        "event_time": ["2024-01-02 03:04:05"],
+        "Cost": ["1 000,5"],
+        "Bayer id": [" 77 "],
+        "campaign": ["x"],
+    })
+    df = normalize_moloco(raw)
+    assert df.columns.tolist() == ["event_date", "traffic_source", "bayer_id", "cost_usd", "cost_rub", "campaign"]
+    assert df["cost_usd"].tolist() == [1000.5]
+    assert np.isnan(df["cost_rub"].iloc[0])
+    assert df["traffic_source"].tolist() == ["Moloco"] and df["bayer_id"].tolist() == ["77"]
+    assert df["event_date"].iloc[0] == pd.Timestamp("2024-01-02")
@@ -0,0 +1,114 @@
+"""Сводные: каждая ячейка, промежуточные и общие итоги — против прямых сумм по кубу."""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import rollup
+from pivot import TOTAL, PivotEngine, PivotSpec, pivot_table
+
+
+@pytest.fixture(scope="module")
+def cube():
+    rng = np.random.default_rng(11)
+    n = 800
+    return pd.DataFrame({
+        "event_date":     pd.Timestamp("2024-01-20") + pd.to_timedelta(rng.integers(0, 70, n), unit="D"),
+        "traffic_source": pd.Categorical(rng.choice(["TikTok", "Moloco", "Google Ads"], n)),
+        "bayer_id":       pd.Categorical(rng.integers(0, 6, n).astype(str)),
+        "cost_usd":       rng.random(n) * 100,
+        "cost_rub":       np.where(rng.random(n) < 0.05, np.nan, rng.random(n) * 9000),
+    })
+
+
+def _labelled(cube: pd.DataFrame) -> pd.DataFrame:
+    """Подписи измерений, посчитанные независимо от cube.time_key."""
+    d = cube["event_date"]
+    return cube.assign(
+        date=d.dt.strftime("%Y-%m-%d"),
+        week=d.dt.to_period("W-SUN").dt.start_time.dt.strftime("%Y-%m-%d"),
+        month=d.dt.strftime("%Y-%m"),
+        traffic_source=cube["traffic_source"].astype(str),
+        bayer_id=cube["bayer_id"].astype(str),
+    )
+
+
+def _prefix(labels) -> list:
+    """Подписи до первого «Итого»: по ним фильтруется ячейка итога."""
+    labels = [x for x in labels if x != ""]
+    return labels[:labels.index(TOTAL)] if TOTAL in labels else labels
+
+
+def _expected(lab: pd.DataFrame, spec: PivotSpec, row: tuple, col: str) -> float:
+    mask = np.ones(len(lab), dtype=bool)
+    for dims, labels in ((spec.rows, row), (spec.cols, col.split(" · "))):
+        for d, value in zip(dims, _prefix(labels)):
+            mask &= (lab[d] == value).to_numpy()
+    return np.nansum(lab.loc[mask, spec.value].to_numpy())
+
+
+SPECS = [
+    PivotSpec(rows=("traffic_source",)),
+    PivotSpec(rows=("month", "traffic_source"), value="cost_usd"),
+    PivotSpec(rows=("traffic_source", "bayer_id"), cols=("week",)),
+    PivotSpec(rows=("bayer_id",), cols=("traffic_source", "month"),
+              start=pd.Timestamp("2024-02-01"), end=pd.Timestamp("2024-02-29")),
+    PivotSpec(rows=("month", "traffic_source", "bayer_id")),
+]
+
+
+@pytest.mark.parametrize("spec", SPECS, ids=lambda s: "×".join(["+".join(s.rows), "+".join(s.cols)]))
+def test_every_cell_matches_direct_sum(cube, spec):
+    table = pivot_table(rollup(cube, spec.dims, spec.value, spec.start, spec.end), spec)
+    lab = _labelled(cube)
+    if spec.start is not None:
+        lab = lab[lab["event_date"].between(spec.start, spec.end)]
+
+    want = np.array([[_expected(lab, spec, row, col) for col in table.columns] for row in table.index])
+    np.testing.assert_allclose(table.to_numpy(), want, rtol=1e-9, atol=1e-6)
+
+    # Все листовые комбинации на месте, общий итог — последней строкой
+    leaves = [r for r in table.index if TOTAL not in r]
+    assert len(leaves) == lab.groupby(list(spec.rows)).ngroups
+    assert table.index[-1][0] == TOTAL
+    assert table.columns[-1].endswith(TOTAL)
+
+
+@pytest.mark.parametrize("spec", [s for s in SPECS if len(s.rows) > 1], ids=lambda s: "+".join(s.rows))
+def test_subtotal_follows_its_children(cube, spec):
+    table = pivot_table(rollup(cube, spec.dims, spec.value), spec)
+    rows = list(table.index)
+    for i, row in enumerate(rows[:-1]):
+        if TOTAL not in row:
+            continue
+        prefix = _prefix(row)
+        block = [j for j, r in enumerate(rows) if j != i and TOTAL not in r[:len(prefix)]
+                 and list(r[:len(prefix)]) == prefix]
+        assert block == list(range(i - len(block), i))
+
+
+@dataclass
+class _Version:
+    """Версия данных для PivotEngine: номер и rollup по кубу."""
+    version: int
+    cube: pd.DataFrame
+    queries: int = 0
+
+    def rollup(self, dims, value, start=None, end=None):
+        self.queries += 1
+        return rollup(self.cube, dims, value, start, end)
+
+
+def test_engine_derives_from_cached_rollup(cube):
+    engine, ds = PivotEngine(), _Version(1, cube)
+    engine.pivot(ds, PivotSpec(rows=("date", "traffic_source"), cols=("bayer_id",)))
+    for spec in [PivotSpec(rows=("month",), cols=("traffic_source",)),
+                 PivotSpec(rows=("bayer_id", "week")),
+                 PivotSpec(rows=("traffic_source",))]:
+        got = engine.pivot(ds, spec)
+        pd.testing.assert_frame_equal(got, pivot_table(rollup(cube, spec.dims, spec.value), spec))
+    assert ds.queries == 1
+    # Другая мера — другой агрегат
+    engine.pivot(ds, PivotSpec(rows=("traffic_source",), value="cost_usd"))
+    assert ds.queries == 2
@@ -0,0 +1,53 @@
+"""Сравнения периодов: RollingStats против прямого суммирования по кубу."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling import STATS, RollingStats, derive_stats, periods
+
+
+@pytest.fixture
+def cube():
+    rng = np.random.default_rng(7)
+    n = 3000
+    days = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 120, n), unit="D")
+    return pd.DataFrame({
+        "event_date":     days,
+        "traffic_source": rng.choice(["Moloco", "TikTok", "Google Ads"], n),
+        "bayer_id":       rng.integers(0, 60, n).astype(str),
+        "cost_usd":       rng.random(n) * 100,
+        "cost_rub":       np.where(rng.random(n) < 0.05, np.nan, rng.random(n) * 9000),
+    })
+
+
+def _brute(cube: pd.DataFrame, key: str, day) -> pd.DataFrame:
+    sums = pd.DataFrame({
+        name: cube[cube["event_date"].between(a, b)].groupby(key)["cost_rub"].sum()
+        for name, (a, b) in periods(day).items()
+    }).reindex(np.sort(cube[key].unique())).fillna(0.0)
+    return derive_stats(sums)
+
+
+@pytest.mark.parametrize("key", ["traffic_source", "bayer_id"])
+@pytest.mark.parametrize("day", ["2024-01-01", "2024-02-29", "2024-03-31", "2024-04-29", "2024-06-01"])
+def test_matches_brute_force(cube, key, day):
+    got = RollingStats(cube, key).stats(day)
+    want = _brute(cube, key, day)
+    assert got.columns.tolist() == STATS
+    assert got.index.tolist() == want.index.tolist()
+    np.testing.assert_allclose(got.to_numpy(), want.to_numpy(), rtol=1e-9, equal_nan=True)
+
+
+def test_empty_cube():
+    empty = pd.DataFrame({
+        "event_date": pd.Series(dtype="datetime64[ns]"), "bayer_id": pd.Series(dtype=object),
+        "cost_rub": pd.Series(dtype="float64"),
+    })
+    assert RollingStats(empty, "bayer_id").stats("2024-01-01").empty
+
+
+def test_categorical_keys_sorted_by_value(cube):
+    # Категории куба идут в порядке появления (union_categoricals), ключи — по алфавиту
+    cat = cube.astype({"bayer_id": pd.CategoricalDtype(cube["bayer_id"].unique())})
+    got = RollingStats(cat, "bayer_id").stats("2024-03-31")
+    pd.testing.assert_frame_equal(got, RollingStats(cube, "bayer_id").stats("2024-03-31"))
@@ -0,0 +1,176 @@
+"""Синхронизация листов на фейковом клиенте gspread (см. benchmarks/fake_gspread.py)."""
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from gspread.exceptions import APIError
+
+import sheets
+from benchmarks.fake_gspread import FakeClient, FakeWorksheet
+from metrics import metrics
+
+HEADER = ["event_time", "cost", "Bayer id"]
+
+
+def _rows(n: int, start: int = 0) -> list:
+    return [[f"2024-01-{i % 28 + 1:02d}", f"{i},00", str(i)] for i in range(start, start + n)]
+
+
+def _api_error(code: int) -> APIError:
+    body = {"error": {"code": code, "message": "quota", "status": "RESOURCE_EXHAUSTED"}}
+    return APIError(SimpleNamespace(json=lambda: body, text=""))
+
+
+@pytest.fixture(autouse=True)
+def _clean_metrics():
+    metrics.reset()
+
+
+@pytest.fixture
+def tab():
+    return [HEADER] + _rows(2500)
+
+
+@pytest.fixture
+def ws(tab):
+    return FakeClient({"m": [tab]}).open_by_key("m").get_worksheet(0)
+
+
+def _sync(ws, root):
+    return sheets.sync_worksheet(ws, "m", root)
+
+
+def _expected(tab) -> pd.DataFrame:
+    return pd.DataFrame(tab[1:], columns=tab[0])
+
+
+def _reloads() -> tuple:
+    c = metrics.counters()
+    return c.get("fetch.full_reload", 0), c.get("fetch.partial_reload", 0)
+
+
+def test_first_sync_is_full_reload(ws, tab, tmp_path):
+    df = _sync(ws, tmp_path)
+    assert df.values.tolist() == tab[1:]
+    assert _reloads() == (1, 0)
+
+
+def test_append_fetches_only_new_rows(ws, tab, tmp_path):
+    _sync(ws, tmp_path)
+    tab.extend(_rows(3, start=2500))
+    calls = ws.calls
+    df = _sync(ws, tmp_path)
+    assert df.values.tolist() == tab[1:]
+    assert ws.calls == calls + 1
+    assert _reloads() == (1, 0)
+
+
+def test_unchanged_sheet_returns_snapshot(ws, tab, tmp_path):
+    _sync(ws, tmp_path)
+    df = _sync(ws, tmp_path)
+    assert df.values.tolist() == tab[1:]
+    assert _reloads() == (1, 0)
+
+
+def test_header_change_forces_full_reload(ws, tab, tmp_path):
+    _sync(ws, tmp_path)
+    tab[0] = ["event_date", "costs", "bayer id"]
+    df = _sync(ws, tmp_path)
+    assert df.columns.tolist() == tab[0]
+    assert _reloads() == (2, 0)
+
+
+def test_edited_earlier_row_reloads_from_its_block(ws, tab, tmp_path):
+    _sync(ws, tmp_path)
+    tab[1500][1] = "777,00"
+    df = _sync(ws, tmp_path)
+    pd.testing.assert_frame_equal(df, _expected(tab), check_dtype=False)
+    assert _reloads() == (1, 1)
+
+
+def test_edit_in_first_block_forces_full_reload(ws, tab, tmp_path):
+    _sync(ws, tmp_path)
+    tab[5][1] = "1 000,00"
+    df = _sync(ws, tmp_path)
+    pd.testing.assert_frame_equal(df, _expected(tab), check_dtype=False)
+    assert _reloads() == (2, 0)
+
+
+def test_deleted_row_is_picked_up(ws, tab, tmp_path):
+    _sync(ws, tmp_path)
+    del tab[2100]
+    df = _sync(ws, tmp_path)
+    pd.testing.assert_frame_equal(df, _expected(tab), check_dtype=False)
+
+
+def test_edit_outside_checked_column_caught_by_age(ws, tab, tmp_path, monkeypatch):
+    _sync(ws, tmp_path)
+    tab[10][2] = "renamed"
+    assert _sync(ws, tmp_path).iloc[9]["Bayer id"] == "9"
+    monkeypatch.setattr(sheets, "FULL_RELOAD_HOURS", 1e-9)
+    assert _sync(ws, tmp_path).iloc[9]["Bayer id"] == "renamed"
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """Первые `failures` запросов batch_get отвечают 429."""
+
+    def __init__(self, *args, failures: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def batch_get(self, ranges):
+        if self.failures:
+            self.failures -= 1
+            raise _api_error(429)
+        return super().batch_get(ranges)
+
+
+def test_quota_error_is_retried_with_backoff(tab, tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(sheets.time, "sleep", sleeps.append)
+    ws = FlakyWorksheet(1, "tab0", tab, failures=0)
+    _sync(ws, tmp_path)
+    tab.extend(_rows(2, start=2500))
+    ws.failures = 2
+    df = _sync(ws, tmp_path)
+    assert df.values.tolist() == tab[1:]
+    assert len(sleeps) == 2 and sleeps[0] < sleeps[1]
+
+
+def test_non_retryable_error_is_raised(monkeypatch):
+    monkeypatch.setattr(sheets.time, "sleep", lambda s: None)
+
+    def fail():
+        raise _api_error(403)
+
+    with pytest.raises(APIError):
+        sheets.with_backoff(fail)
+
+
+def test_retries_are_bounded(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(sheets.time, "sleep", sleeps.append)
+
+    def fail():
+        raise _api_error(429)
+
+    with pytest.raises(APIError):
+        sheets.with_backoff(fail, retries=3)
+    assert len(sleeps) == 3
+
+
+def test_fetch_moloco_keeps_tab_order(tmp_path):
+    tabs = [[HEADER] + _rows(10, start=10 * i) for i in range(6)]
+    df = sheets.fetch_moloco(FakeClient({"m": tabs}), "m", tmp_path)
+    assert df["Bayer id"].tolist() == [str(i) for i in range(60)]
+    assert (df["traffic_source"] == "Moloco").all()
+
+
+def test_snapshots_follow_deleted_tabs(tmp_path):
+    tabs = [[HEADER] + _rows(10), [HEADER] + _rows(10, start=10)]
+    client = FakeClient({"m": tabs})
+    sheets.fetch_moloco(client, "m", tmp_path)
+    client.open_by_key("m")._worksheets.pop(0)
+    live = sheets.fetch_moloco(client, "m", tmp_path)
+    snap, _ = sheets.read_snapshots("m", tmp_path)
+    assert len(live) == len(snap) == 10
@@ -0,0 +1,81 @@
+"""Версии в SQLite: публикация разницы и чтение вытесненных версий."""
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sqlstore import SqlStore
+
+
+def _frame(n: int, source: str, start="2024-01-01") -> pd.DataFrame:
+    """Нормализованный фрейм (типы как у normalize.py)."""
+    df = pd.DataFrame({
+        "event_date":     pd.date_range(start, periods=n, freq="D").repeat(2)[:n],
+        "traffic_source": source,
+        "bayer_id":       [str(i % 7) for i in range(n)],
+        "cost_usd":       np.arange(n, dtype="float64"),
+        "cost_rub":       np.arange(n, dtype="float64") * 90,
+    })
+    return df.astype({"traffic_source": "category", "bayer_id": "category"})
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def moloco():
+    return _frame(40, "Moloco")
+
+
+@pytest.fixture
+def other():
+    return _frame(30, "TikTok")
+
+
+def test_publish_inserts_only_changed_rows(tmp_path, moloco, other):
+    store = SqlStore(tmp_path / "data.db")
+    store.publish(moloco, other, _now())
+    edited = pd.concat([moloco.iloc[1:], _frame(3, "Moloco", "2024-03-01")], ignore_index=True)
+    edited = edited.astype({"traffic_source": "category", "bayer_id": "category"})
+    edited.loc[5, "cost_rub"] += 1
+    ds = store.publish(edited, other, _now())
+
+    conn = store.connection()
+    count = lambda where: conn.execute(f"SELECT COUNT(*) FROM rows WHERE {where}").fetchone()[0]
+    assert count(f"first_v = {ds.version}") == 4    # три новые и правленая
+    assert count(f"last_v = {ds.version}") == 2     # удалённая и старая правленая
+    rows = ds.select("moloco", sort_by="cost_rub")
+    page = ds.page("moloco", rows, 0, 100)
+    assert page["cost_rub"].tolist() == sorted(edited["cost_rub"].tolist())
+
+
+def test_duplicate_rows_are_kept(tmp_path, other):
+    store = SqlStore(tmp_path / "data.db")
+    twice = pd.concat([other, other.iloc[:3]], ignore_index=True)
+    ds = store.publish(twice, other, _now())
+    assert ds.table_info("moloco")["rows"] == len(twice)
+    ds = store.publish(twice.iloc[:-1], other, _now())
+    assert ds.table_info("moloco")["rows"] == len(twice) - 1
+
+
+def test_pruned_version_falls_back_to_current(tmp_path, moloco, other):
+    reader = SqlStore(tmp_path / "data.db", keep=1, grace_s=0)
+    writer = SqlStore(tmp_path / "data.db", keep=1, grace_s=0)
+    first = reader.publish(moloco, other, _now())
+    assert reader.get(first.version) is first
+
+    latest = writer.publish(moloco.iloc[:-1], other, _now())
+    ds = reader.get(first.version)
+    assert ds.version == latest.version
+    assert ds.table_info("moloco")["rows"] == len(moloco) - 1
+
+
+def test_superseded_version_kept_for_grace_period(tmp_path, moloco, other):
+    store = SqlStore(tmp_path / "data.db", keep=1)
+    first = store.publish(moloco, other, _now())
+    store.publish(moloco.iloc[:-1], other, _now())
+    ds = store.get(first.version)
+    assert ds.version == first.version
+    assert ds.table_info("moloco")["rows"] == len(moloco)
@@ -0,0 +1,108 @@
+"""Табличные данные: фильтры, сортировка, страницы и выгрузка против pandas."""
+import io
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from sqlstore import SqlStore
+from table_view import export_file, page_slice, select_rows, sort_rows
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(3)
+    n = 2000
+    cost = rng.integers(0, 50, n) * 10.0                  # много равных — проверка устойчивости
+    cost[rng.random(n) < 0.1] = np.nan
+    bayer = rng.integers(0, 300, n).astype(str).astype(object)
+    bayer[rng.random(n) < 0.05] = np.nan
+    # Категории в порядке появления, как после normalize.py
+    return pd.DataFrame({
+        "event_date":     pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 90, n), unit="D"),
+        "traffic_source": pd.Categorical(rng.choice(["TikTok", "Google Ads", "Telegram Ads"], n)),
+        "bayer_id":       pd.Categorical(bayer, categories=pd.unique(bayer[pd.notna(bayer)])),
+        "cost_usd":       cost / 90,
+        "cost_rub":       cost,
+    })
+
+
+def _brute_select(df, start, end, sources, bayer):
+    mask = df["event_date"].between(pd.Timestamp(start), pd.Timestamp(end))
+    if sources:
+        mask &= df["traffic_source"].isin(sources)
+    if bayer:
+        mask &= df["bayer_id"].astype(object).str.contains(bayer, case=False, regex=False).fillna(False).astype(bool)
+    return np.flatnonzero(mask.to_numpy())
+
+
+def _brute_sort(df, rows, by, ascending):
+    values = df[by].iloc[rows]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    keys = pd.DataFrame({"v": values.to_numpy(), "row": rows})
+    keys = keys.sort_values("v", ascending=ascending, kind="stable", na_position="last")
+    return keys["row"].to_numpy()
+
+
+@pytest.mark.parametrize("sources, bayer", [((), ""), (("TikTok",), ""), ((), "12"), (("TikTok", "Google Ads"), "7")])
+def test_select_matches_pandas(df, sources, bayer):
+    rows = select_rows(df, "2024-01-10", "2024-02-20",
+                       filters={"traffic_source": list(sources)}, search={"bayer_id": bayer})
+    np.testing.assert_array_equal(rows, _brute_select(df, "2024-01-10", "2024-02-20", sources, bayer))
+
+
+@pytest.mark.parametrize("by", ["event_date", "bayer_id", "traffic_source", "cost_rub"])
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sort_matches_pandas(df, by, ascending):
+    rows = select_rows(df, filters={"traffic_source": ["TikTok", "Telegram Ads"]})
+    np.testing.assert_array_equal(sort_rows(df, rows, by, ascending), _brute_sort(df, rows, by, ascending))
+
+
+def test_pages_cover_selection(df):
+    rows = sort_rows(df, select_rows(df, search={"bayer_id": "1"}), "cost_rub", False)
+    pages = [page_slice(df, rows, p, 64) for p in range(-(-len(rows) // 64))]
+    pd.testing.assert_frame_equal(pd.concat(pages), df.iloc[rows])
+    assert page_slice(df, rows, len(pages), 64).empty
+
+
+def _download(data) -> bytes:
+    """Что получит браузер по нажатию download_button."""
+    out, _ = convert_data_to_bytes_and_infer_mime(data, RuntimeError("unsupported type"))
+    return out
+
+
+@pytest.mark.parametrize("chunk", [7, 100_000])
+def test_export_through_download_button(df, chunk):
+    rows = sort_rows(df, select_rows(df, filters={"traffic_source": ["TikTok"]}), "cost_rub")
+    want = df.iloc[rows].reset_index(drop=True)
+
+    csv = _download(export_file(df, rows, "csv", chunk=chunk))
+    assert csv.startswith("\ufeff".encode())
+    got = pd.read_csv(io.BytesIO(csv), encoding="utf-8-sig", dtype={"bayer_id": object})
+    assert len(got) == len(want)
+    np.testing.assert_allclose(got["cost_rub"], want["cost_rub"], equal_nan=True)
+
+    got = pd.read_parquet(io.BytesIO(_download(export_file(df, rows, "parquet", chunk=chunk))))
+    pd.testing.assert_frame_equal(got, want, check_dtype=False, check_categorical=False)
+
+
+def test_export_empty_selection_keeps_columns(df):
+    rows = select_rows(df, search={"bayer_id": "no such bayer"})
+    header = _download(export_file(df, rows, "csv")).decode("utf-8-sig").strip()
+    assert header.split(",") == df.columns.tolist()
+    assert pd.read_parquet(io.BytesIO(_download(export_file(df, rows, "parquet")))).columns.tolist() == df.columns.tolist()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_sql_export_through_download_button(tmp_path, df, fmt):
+    ds = SqlStore(tmp_path / "data.db").publish(df, df.iloc[:0], datetime.now(timezone.utc))
+    sel = ds.select("moloco", sources=("TikTok",), sort_by="cost_rub")
+    data = _download(ds.export("moloco", sel, fmt, chunk=50))
+    got = (pd.read_csv(io.BytesIO(data), encoding="utf-8-sig") if fmt == "csv"
+           else pd.read_parquet(io.BytesIO(data)))
+    want = df.iloc[sort_rows(df, select_rows(df, filters={"traffic_source": ["TikTok"]}), "cost_rub")]
+    assert len(got) == len(want)
+    np.testing.assert_allclose(got["cost_rub"], want["cost_rub"], equal_nan=True)